@@ -8,202 +8,370 @@ No interactive mode, no complex logic - just the runtime entrypoint.
 
 import os
 import sys
-import boto3
-import json
-import requests
+import asyncio
+import orjson
 import uuid
-import base64
+import hashlib
+import time
+import binascii
+import sqlite3
+import tempfile
+import threading
+import functools
+import atexit
+from types import MappingProxyType
+from concurrent.futures import ThreadPoolExecutor
+from botocore.config import Config
 from strands import Agent
 from strands.models import BedrockModel
 from strands.tools import tool
-from strands.tools.mcp import MCPClient
-from mcp.client.streamable_http import streamablehttp_client
-from memory_hooks import CustomerRetentionMemoryHooks
 from bedrock_agentcore.runtime import BedrockAgentCoreApp
 
 # Configure logging
 import logging
-logging.basicConfig(level=logging.INFO)
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'WARNING').upper())
 logger = logging.getLogger(__name__)
 
 # AWS Configuration
 REGION = os.environ.get('AWS_DEFAULT_REGION', 'us-east-1')
-ACCOUNT_ID = boto3.client('sts').get_caller_identity()['Account']
+
+# Shared botocore config: keep-alive sockets reused under concurrency, short
+# timeouts so a degraded dependency fails fast, and adaptive (client-side
+# rate limited) retries instead of the legacy retry storm
+BOTO_CONFIG = Config(
+    connect_timeout=2,
+    read_timeout=10,
+    retries={"mode": "adaptive", "max_attempts": 3},
+    max_pool_connections=50,
+    tcp_keepalive=True
+)
+
+# Bedrock responses are streamed for the whole generation, so allow longer reads
+BEDROCK_CONFIG = BOTO_CONFIG.merge(Config(read_timeout=120))
+
+# Cognito token endpoint (connect, read) timeouts in seconds
+COGNITO_TIMEOUT = (2, 5)
+COGNITO_MAX_RETRIES = 3
+
+# Parameter Store Paths
+COGNITO_M2M_CLIENT_ID_PATH = "/customer-retention-agent/cognito/m2m-client-id"
+COGNITO_M2M_CLIENT_SECRET_PATH = "/customer-retention-agent/cognito/m2m-client-secret"
+COGNITO_AUTH_SCOPE_PATH = "/customer-retention-agent/cognito/auth-scope"
+GATEWAY_URL_PATH = "/customer-retention-agent/gateway/url"
+MEMORY_ID_PATH = "/customer-retention-agent/memory/id"
+
+# Everything create_agent needs, fetched in a single GetParameters call
+AGENT_PARAMETER_PATHS = [
+    COGNITO_M2M_CLIENT_ID_PATH,
+    COGNITO_M2M_CLIENT_SECRET_PATH,
+    COGNITO_AUTH_SCOPE_PATH,
+    GATEWAY_URL_PATH,
+    MEMORY_ID_PATH,
+]
+
+# Batch inference configuration (non-interactive workloads)
+BATCH_S3_URI_PATH = "/customer-retention-agent/batch/s3-uri"
+BATCH_ROLE_ARN_PATH = "/customer-retention-agent/batch/role-arn"
+BATCH_POLL_INTERVAL_SECONDS = 20
+# "wait": true gives up polling after this long and returns the job ARN to check later
+BATCH_WAIT_TIMEOUT_SECONDS = int(os.environ.get('BATCH_WAIT_TIMEOUT_SECONDS', '600'))
+# Bedrock rejects batch jobs below a per-model minimum number of records
+BATCH_MIN_RECORDS = int(os.environ.get('BATCH_MIN_RECORDS', '100'))
+# Bedrock's default per-job record quota
+BATCH_MAX_RECORDS = int(os.environ.get('BATCH_MAX_RECORDS', '50000'))
+BATCH_TERMINAL_STATUSES = {"Completed", "PartiallyCompleted", "Failed", "Stopped", "Expired"}
+
+# Customer -> last memory session, so reconnects resume the same session
+SESSION_DB_PATH = os.environ.get(
+    'SESSION_DB_PATH', os.path.join(tempfile.gettempdir(), 'customer-retention-sessions.sqlite3')
+)
+SESSION_TTL_SECONDS = int(os.environ.get('SESSION_TTL_SECONDS', '86400'))
+
+# Rebuild cached agents after this long (kept below the Cognito token lifetime)
+AGENT_CACHE_TTL_SECONDS = int(os.environ.get('AGENT_CACHE_TTL_SECONDS', '600'))
+
+# Bedrock model used by the agent and by batch jobs
+MODEL_ID = "us.anthropic.claude-3-7-sonnet-20250219-v1:0"
+
+# Bedrock inference latency profile ("standard" or "optimized"). Latency-optimized
+# inference only exists for some model/region pairs and Converse rejects it elsewhere,
+# so it is opt-in and performanceConfig is only sent when it is enabled.
+BEDROCK_LATENCY_MODE = os.environ.get('BEDROCK_LATENCY_MODE', 'standard')
+
+# Connect to SSM, Cognito and the Gateway at startup instead of on the first request
+WARM_START = os.environ.get('WARM_START', '0') == '1'
 
 # User ID to Customer ID mapping
-# This maps Cognito user IDs to actual customer IDs in your database
-USER_CUSTOMER_MAPPING = {
+# This maps Cognito user IDs to actual customer IDs in your database (read-only at runtime)
+USER_CUSTOMER_MAPPING = MappingProxyType({
     "d4e884b8-70a1-7024-9457-deb37a8c77cb": "3916-NRPAP",  
     # Add more mappings as needed
-}
+})
+
+# Map the URL-safe base64 alphabet used by JWTs onto the standard one
+_B64URL_TO_STANDARD = bytes.maketrans(b'-_', b'+/')
 
+@functools.lru_cache(maxsize=1024)
 def decode_jwt_token(token):
-    """Decode JWT token to extract user ID"""
+    """Decode the JWT payload claims (memoized per raw token, so returned read-only)"""
     try:
         if not token:
             return None
         
-        # Split the token
-        parts = token.split('.')
-        if len(parts) != 3:
-            logger.warning(f"Invalid JWT format: expected 3 parts, got {len(parts)}")
+        # header.payload.signature - check the shape without splitting
+        dots = token.count('.')
+        if dots != 2:
+            logger.warning("Invalid JWT format: expected 3 parts, got %d", dots + 1)
             return None
         
         # Decode the payload (middle part)
-        payload = parts[1]
-        # Add padding if needed
-        payload += '=' * (4 - len(payload) % 4)
-        decoded = base64.b64decode(payload)
-        payload_data = json.loads(decoded)
-        
-        # Extract user ID from 'sub' field
-        user_id = payload_data.get('sub')
-        logger.info(f"Extracted user_id from JWT: {user_id}")
-        return user_id
+        start = token.index('.') + 1
+        payload = token[start:token.index('.', start)]
+        # JWTs use the URL-safe alphabet without padding
+        payload_bytes = payload.encode('ascii').translate(_B64URL_TO_STANDARD)
+        decoded = binascii.a2b_base64(payload_bytes + b'==='[:-len(payload_bytes) & 3])
+        return MappingProxyType(orjson.loads(decoded))
         
     except Exception as e:
         logger.error(f"Error decoding JWT token: {e}")
         return None
 
-def get_customer_id_from_user_id(user_id):
-    """
-    Map Cognito user ID to actual customer ID.
-    
-    Args:
-        user_id (str): The authenticated user ID from Cognito
+# One boto3 session (credentials, endpoint data) shared by every client
+_BOTO_SESSION = None
+
+# boto3 clients, created on first use so importing the module makes no AWS calls
+_AWS_CLIENTS = {}
+_AWS_CLIENTS_LOCK = threading.RLock()
+
+def get_boto_session():
+    """Return the shared boto3 session, creating it on first use."""
+    global _BOTO_SESSION
+    if _BOTO_SESSION is None:
+        with _AWS_CLIENTS_LOCK:
+            if _BOTO_SESSION is None:
+                import boto3
+                _BOTO_SESSION = boto3.session.Session(region_name=REGION)
+    return _BOTO_SESSION
+
+def get_aws_client(service_name: str):
+    """Return the shared boto3 client for a service, creating it on first use."""
+    client = _AWS_CLIENTS.get(service_name)
+    if client is None:
+        # Client creation from a shared session is not thread-safe
+        with _AWS_CLIENTS_LOCK:
+            client = _AWS_CLIENTS.get(service_name)
+            if client is None:
+                client = get_boto_session().client(service_name, config=BOTO_CONFIG)
+                _AWS_CLIENTS[service_name] = client
+    return client
+
+# Pooled HTTP session so Cognito token requests reuse the TLS connection
+_HTTP_SESSION = None
+
+def get_http_session():
+    """Return the shared requests session, importing requests on first use."""
+    global _HTTP_SESSION
+    if _HTTP_SESSION is None:
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
         
-    Returns:
-        str: The actual customer ID to use for database queries
-    """
-    if not user_id:
-        logger.warning("user_id is None or empty")
-        return None
-    
-    # Check if we have a mapping for this user
-    customer_id = USER_CUSTOMER_MAPPING.get(user_id)
-    if customer_id:
-        logger.info(f"User mapping: {user_id} -> {customer_id}")
-        return customer_id
-    
-    # If no mapping found, use the user_id as customer_id (fallback)
-    logger.warning(f"No mapping found for user_id: {user_id}, using as customer_id")
-    return user_id
+        # Retry throttling and transient Cognito 5xx responses instead of failing the invoke
+        retries = Retry(
+            total=COGNITO_MAX_RETRIES,
+            backoff_factor=0.2,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods={"POST"}
+        )
+        session = requests.Session()
+        session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=retries))
+        _HTTP_SESSION = session
+    return _HTTP_SESSION
+
+# Parameter values cached per container: name -> (value, fetched_at)
+_SSM_CACHE = {}
+_SSM_CACHE_LOCK = threading.Lock()
+
+# Re-read parameters after this many seconds so rotated values are picked up
+SSM_CACHE_TTL = float(os.environ.get('SSM_CACHE_TTL', '300'))
+
+# Cognito access tokens keyed by (client_id, scope) -> (token, expires_at)
+_TOKEN_CACHE = {}
+_TOKEN_CACHE_LOCK = threading.Lock()
 
-# SSM Client for retrieving configuration
-SSM_CLIENT = boto3.client('ssm', region_name=REGION)
+# Refresh tokens this many seconds before Cognito says they expire
+TOKEN_EXPIRY_SKEW_SECONDS = 60
+
+def _cached_ssm_value(name: str, now: float):
+    """Return the cached value for a parameter, or None if missing or stale."""
+    entry = _SSM_CACHE.get(name)
+    if entry and now - entry[1] < SSM_CACHE_TTL:
+        return entry[0]
+    return None
 
 def get_ssm_parameter(name: str) -> str:
-    """Retrieve a parameter from SSM Parameter Store."""
-    try:
-        response = SSM_CLIENT.get_parameter(Name=name, WithDecryption=True)
-        return response['Parameter']['Value']
-    except Exception as e:
-        logger.error(f"Error retrieving SSM parameter '{name}': {e}")
-        raise
+    """Retrieve a parameter from SSM Parameter Store (cached for SSM_CACHE_TTL)."""
+    return get_ssm_parameters([name])[name]
+
+def get_ssm_parameters(names: list) -> dict:
+    """Retrieve several parameters from SSM Parameter Store in one round-trip."""
+    values = {name: _cached_ssm_value(name, time.monotonic()) for name in names}
+    if None not in values.values():
+        return values
+    
+    # Only one thread refreshes; the others pick up its results
+    with _SSM_CACHE_LOCK:
+        now = time.monotonic()
+        values = {name: _cached_ssm_value(name, now) for name in names}
+        missing = [name for name, value in values.items() if value is None]
+        if missing:
+            try:
+                response = get_aws_client('ssm').get_parameters(Names=missing, WithDecryption=True)
+            except Exception as e:
+                logger.error(f"Error retrieving SSM parameters {missing}: {e}")
+                raise
+            if response.get('InvalidParameters'):
+                raise ValueError(f"SSM parameters not found: {response['InvalidParameters']}")
+            for parameter in response['Parameters']:
+                _SSM_CACHE[parameter['Name']] = (parameter['Value'], now)
+                values[parameter['Name']] = parameter['Value']
+    return values
 
 def get_cognito_token() -> str:
     """Get access token from Cognito for Gateway authentication."""
     try:
         # Get Cognito configuration from SSM
-        client_id = get_ssm_parameter("/customer-retention-agent/cognito/m2m-client-id")
-        client_secret = get_ssm_parameter("/customer-retention-agent/cognito/m2m-client-secret")
-        scope = get_ssm_parameter("/customer-retention-agent/cognito/auth-scope")
-        
-        # Use the correct token URL format from the discovery document
-        token_url = "https://us-east-1u4mavayc5.auth.us-east-1.amazoncognito.com/oauth2/token"
-        
-        # Request token from Cognito
-        headers = {"Content-Type": "application/x-www-form-urlencoded"}
-        data = {
-            "grant_type": "client_credentials",
-            "client_id": client_id,
-            "client_secret": client_secret,
-            "scope": scope
-        }
+        parameters = get_ssm_parameters(AGENT_PARAMETER_PATHS)
+        client_id = parameters[COGNITO_M2M_CLIENT_ID_PATH]
+        client_secret = parameters[COGNITO_M2M_CLIENT_SECRET_PATH]
+        scope = parameters[COGNITO_AUTH_SCOPE_PATH]
         
-        response = requests.post(token_url, headers=headers, data=data)
-        response.raise_for_status()
-        token_data = response.json()
+        # Reuse the cached token until it is about to expire
+        cached = _TOKEN_CACHE.get((client_id, scope))
+        if cached and time.monotonic() < cached[1]:
+            return cached[0]
         
-        return token_data["access_token"]
+        # Single flight: concurrent callers wait for one refresh and share it
+        with _TOKEN_CACHE_LOCK:
+            cached = _TOKEN_CACHE.get((client_id, scope))
+            if cached and time.monotonic() < cached[1]:
+                return cached[0]
+            return _request_cognito_token(client_id, client_secret, scope)
         
     except Exception as e:
         logger.error(f"Error getting Cognito token: {e}")
         raise
 
-@tool
-def get_product_catalog() -> str:
-    """
-    Get information about available telecom plans and services.
+def _request_cognito_token(client_id: str, client_secret: str, scope: str) -> str:
+    """Mint a new client_credentials token and store it in the token cache."""
+    # Use the correct token URL format from the discovery document
+    token_url = "https://us-east-1u4mavayc5.auth.us-east-1.amazoncognito.com/oauth2/token"
     
-    Returns:
-        str: Information about available plans, pricing, and features
-    """
-    try:
-        # Internal tool - Product Catalog information
-        product_info = {
-            "plans": [
-                {
-                    "name": "Basic Plan",
-                    "price": "$29.99/month",
-                    "features": ["Unlimited calls", "1GB data", "Basic support"],
-                    "target_customers": "Low usage customers"
-                },
-                {
-                    "name": "Premium Plan", 
-                    "price": "$59.99/month",
-                    "features": ["Unlimited calls", "10GB data", "Premium support", "International calls"],
-                    "target_customers": "High usage customers"
-                },
-                {
-                    "name": "Family Plan",
-                    "price": "$89.99/month", 
-                    "features": ["4 lines", "Unlimited data", "Family controls", "Premium support"],
-                    "target_customers": "Family customers"
-                }
-            ],
-            "add_ons": [
-                {
-                    "name": "International Roaming",
-                    "price": "$15/month",
-                    "description": "Unlimited international calls and data"
-                },
-                {
-                    "name": "Device Protection",
-                    "price": "$8/month", 
-                    "description": "Device insurance and replacement"
-                }
-            ],
-            "retention_offers": [
-                {
-                    "type": "discount",
-                    "description": "20% off for 6 months",
-                    "eligibility": "High churn risk customers"
-                },
-                {
-                    "type": "upgrade",
-                    "description": "Free plan upgrade for 3 months",
-                    "eligibility": "Medium churn risk customers"
-                }
-            ]
+    # Request token from Cognito
+    headers = {"Content-Type": "application/x-www-form-urlencoded"}
+    data = {
+        "grant_type": "client_credentials",
+        "client_id": client_id,
+        "client_secret": client_secret,
+        "scope": scope
+    }
+    
+    response = get_http_session().post(token_url, headers=headers, data=data, timeout=COGNITO_TIMEOUT)
+    response.raise_for_status()
+    token_data = orjson.loads(response.content)
+    
+    access_token = token_data["access_token"]
+    expires_at = time.monotonic() + token_data.get("expires_in", 3600) - TOKEN_EXPIRY_SKEW_SECONDS
+    _TOKEN_CACHE[(client_id, scope)] = (access_token, expires_at)
+    
+    return access_token
+
+# Internal tool - Product Catalog information (static, rendered once at import)
+PRODUCT_CATALOG = {
+    "plans": [
+        {
+            "name": "Basic Plan",
+            "price": "$29.99/month",
+            "features": ["Unlimited calls", "1GB data", "Basic support"],
+            "target_customers": "Low usage customers"
+        },
+        {
+            "name": "Premium Plan", 
+            "price": "$59.99/month",
+            "features": ["Unlimited calls", "10GB data", "Premium support", "International calls"],
+            "target_customers": "High usage customers"
+        },
+        {
+            "name": "Family Plan",
+            "price": "$89.99/month", 
+            "features": ["4 lines", "Unlimited data", "Family controls", "Premium support"],
+            "target_customers": "Family customers"
         }
-        
-        return f"""
+    ],
+    "add_ons": [
+        {
+            "name": "International Roaming",
+            "price": "$15/month",
+            "description": "Unlimited international calls and data"
+        },
+        {
+            "name": "Device Protection",
+            "price": "$8/month", 
+            "description": "Device insurance and replacement"
+        }
+    ],
+    "retention_offers": [
+        {
+            "type": "discount",
+            "description": "20% off for 6 months",
+            "eligibility": "High churn risk customers"
+        },
+        {
+            "type": "upgrade",
+            "description": "Free plan upgrade for 3 months",
+            "eligibility": "Medium churn risk customers"
+        }
+    ]
+}
+
+def _render_product_catalog(product_info: dict) -> str:
+    """Render the product catalog as the text returned to the model."""
+    plans = "\n".join(
+        f"• {plan['name']}: {plan['price']} - {', '.join(plan['features'])}"
+        for plan in product_info['plans']
+    )
+    add_ons = "\n".join(
+        f"• {addon['name']}: {addon['price']} - {addon['description']}"
+        for addon in product_info['add_ons']
+    )
+    retention_offers = "\n".join(
+        f"• {offer['type'].title()}: {offer['description']} (for {offer['eligibility']})"
+        for offer in product_info['retention_offers']
+    )
+    return f"""
 📋 **Telecom Product Catalog**
 
 **Available Plans:**
-{chr(10).join([f"• {plan['name']}: {plan['price']} - {', '.join(plan['features'])}" for plan in product_info['plans']])}
+{plans}
 
 **Add-on Services:**
-{chr(10).join([f"• {addon['name']}: {addon['price']} - {addon['description']}" for addon in product_info['add_ons']])}
+{add_ons}
 
 **Retention Offers:**
-{chr(10).join([f"• {offer['type'].title()}: {offer['description']} (for {offer['eligibility']})" for offer in product_info['retention_offers']])}
-        """
-        
-    except Exception as e:
-        logger.error(f"Error getting product catalog: {str(e)}")
-        return f"Error retrieving product catalog: {str(e)}"
+{retention_offers}
+    """
+
+_PRODUCT_CATALOG_TEXT = _render_product_catalog(PRODUCT_CATALOG)
+
+@tool
+def get_product_catalog() -> str:
+    """
+    Get information about available telecom plans and services.
+    
+    Returns:
+        str: Information about available plans, pricing, and features
+    """
+    return _PRODUCT_CATALOG_TEXT
 
 # System prompt for the Customer Retention Agent
 SYSTEM_PROMPT = """
@@ -243,26 +411,36 @@ You are a Customer Retention Agent for a telecom company. Your primary goal is t
 - Always provide actual discount codes when requested
 """
 
-def create_agent(customer_id=None):
+# Gateway MCP session shared by every agent: (mcp_client, external_tools, access_token)
+_GATEWAY_MCP = None
+# Client replaced at the last token rotation, closed at the next one
+_RETIRED_MCP_CLIENT = None
+_GATEWAY_MCP_LOCK = threading.Lock()
+
+def get_gateway_tools():
     """
-    Create the Customer Retention Agent with internal tools, Gateway, and Memory.
+    Return the shared Gateway MCP client and its tools, connecting on first use.
     
-    Args:
-        customer_id (str): The customer ID to use for memory context
+    The Gateway tool set is the same for every customer, so one MCP session
+    serves all agents. It is reconnected when the Cognito token rotates; the
+    previous client stays open until the next rotation so requests still
+    running on older agents can finish.
+    
+    Returns:
+        tuple: (mcp_client, external_tools)
     """
-    try:
-        # Initialize the Bedrock model
-        model = BedrockModel(
-            model_id="us.anthropic.claude-3-7-sonnet-20250219-v1:0",
-            temperature=0.3,
-            region_name=REGION
-        )
-        
-        # Get Gateway configuration
-        gateway_url = get_ssm_parameter("/customer-retention-agent/gateway/url")
+    global _GATEWAY_MCP, _RETIRED_MCP_CLIENT
+    
+    # The MCP SDK is only needed once an agent is built - keep it off the import path
+    from strands.tools.mcp import MCPClient
+    from mcp.client.streamable_http import streamablehttp_client
+    
+    access_token = get_cognito_token()
+    with _GATEWAY_MCP_LOCK:
+        if _GATEWAY_MCP and _GATEWAY_MCP[2] == access_token:
+            return _GATEWAY_MCP[0], _GATEWAY_MCP[1]
         
-        # Get Cognito token for Gateway authentication
-        access_token = get_cognito_token()
+        gateway_url = get_ssm_parameters(AGENT_PARAMETER_PATHS)[GATEWAY_URL_PATH]
         
         # Create MCP client for Gateway
         mcp_client = MCPClient(
@@ -276,21 +454,76 @@ def create_agent(customer_id=None):
         mcp_client.start()
         external_tools = mcp_client.list_tools_sync()
         
-        # Combine internal and external tools
-        all_tools = [get_product_catalog] + external_tools
+        if _RETIRED_MCP_CLIENT is not None:
+            try:
+                _RETIRED_MCP_CLIENT.close()
+            except Exception:
+                pass
+        _RETIRED_MCP_CLIENT = _GATEWAY_MCP[0] if _GATEWAY_MCP else None
+        _GATEWAY_MCP = (mcp_client, external_tools, access_token)
+        
+        return mcp_client, external_tools
+
+# Worker threads for the independent network calls made while building an agent
+_SETUP_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="agent-setup")
+
+def create_agent(customer_id=None, session_id=None):
+    """
+    Create the Customer Retention Agent with internal tools, Gateway, and Memory.
+    
+    Args:
+        customer_id (str): The customer ID to use for memory context
+        session_id (str): The memory session ID (defaults to the customer ID)
         
-        # Initialize Memory Hooks
-        memory_id = get_ssm_parameter("/customer-retention-agent/memory/id")
+    Returns:
+        tuple: (agent, mcp_client, memory_hooks)
+    """
+    # Memory hooks pull in the AgentCore Memory SDK - load it with the first agent
+    from memory_hooks import CustomerRetentionMemoryHooks
+    
+    try:
+        # Initialize the Bedrock model (it builds its client from the shared session)
+        model_options = {}
+        if BEDROCK_LATENCY_MODE == "optimized":
+            # Top-level Converse request field (performanceConfig is not a model field)
+            model_options["additional_args"] = {"performanceConfig": {"latency": "optimized"}}
+        with _AWS_CLIENTS_LOCK:
+            model = BedrockModel(
+                model_id=MODEL_ID,
+                temperature=0.3,
+                boto_session=get_boto_session(),
+                boto_client_config=BEDROCK_CONFIG,
+                **model_options,
+                # Insert Bedrock cachePoint blocks after the system prompt and tool specs
+                cache_prompt="default",
+                cache_tools="default"
+            )
+        
+        # Fetch all configuration in one batch (shared with get_cognito_token)
+        parameters = get_ssm_parameters(AGENT_PARAMETER_PATHS)
+        memory_id = parameters[MEMORY_ID_PATH]
         
         # Use provided customer_id or fall back to session-based ID
         if not customer_id:
-            session_id = str(uuid.uuid4())
+            session_id = session_id or str(uuid.uuid4())
             customer_id = f"session-{session_id[:8]}"
-        else:
+        elif not session_id:
             # Use customer_id as session_id for consistent memory across conversations
             session_id = customer_id
-            
-        memory_hooks = CustomerRetentionMemoryHooks(memory_id, customer_id, session_id, REGION)
+        
+        # Initialize Memory Hooks (loads memory strategies) while the Gateway
+        # connection is being set up - the two don't depend on each other
+        memory_hooks_future = _SETUP_EXECUTOR.submit(
+            CustomerRetentionMemoryHooks, memory_id, customer_id, session_id, REGION
+        )
+        
+        # External tools come from the Gateway session shared by all agents
+        mcp_client, external_tools = get_gateway_tools()
+        
+        # Combine internal and external tools
+        all_tools = [get_product_catalog] + external_tools
+        
+        memory_hooks = memory_hooks_future.result()
         
         # Create agent with all tools and memory hooks
         agent = Agent(
@@ -301,34 +534,391 @@ def create_agent(customer_id=None):
         )
         
         logger.info("✅ Customer Retention Agent created successfully!")
-        logger.info(f"Internal tools: {[get_product_catalog.__name__]}")
-        logger.info(f"External tools: {[tool.tool_name for tool in external_tools]}")
-        logger.info(f"Total tools: {len(all_tools)}")
-        logger.info(f"Memory integration: Active (customer: {customer_id})")
-        logger.info(f"Session ID: {session_id}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Tools (%d): %s", len(all_tools), [t.tool_name for t in all_tools])
+        logger.info("Memory integration: Active (customer: %s)", customer_id)
+        logger.info("Session ID: %s", session_id)
         
-        return agent, mcp_client
+        return agent, mcp_client, memory_hooks
         
     except Exception as e:
         logger.error(f"Error creating agent: {str(e)}")
         raise
 
+def _split_s3_uri(s3_uri: str) -> tuple:
+    """Split an s3://bucket/prefix URI into (bucket, prefix)."""
+    bucket, _, prefix = s3_uri[len("s3://"):].partition('/')
+    return bucket, prefix.strip('/')
+
+def _batch_job_prefix(owner: str) -> str:
+    """Job-name prefix that ties a batch job to the user who submitted it."""
+    return f"customer-retention-batch-{hashlib.sha256(owner.encode()).hexdigest()[:16]}-"
+
+def submit_batch_job(prompts: list, owner: str, max_tokens: int = 1024) -> str:
+    """
+    Submit prompts to Bedrock batch inference as a single job.
+    
+    Each prompt becomes one record answered with the agent's system prompt.
+    Tools and memory are not available to batch records.
+    
+    Args:
+        prompts (list): The prompts to run
+        owner (str): The authenticated user submitting the job, recorded in the job name
+        max_tokens (int): Maximum tokens to generate per record
+        
+    Returns:
+        str: The model invocation job ARN
+    """
+    try:
+        parameters = get_ssm_parameters([BATCH_S3_URI_PATH, BATCH_ROLE_ARN_PATH])
+        bucket, prefix = _split_s3_uri(parameters[BATCH_S3_URI_PATH])
+        job_name = f"{_batch_job_prefix(owner)}{uuid.uuid4().hex[:12]}"
+        
+        # One JSONL record per prompt in the Anthropic Messages format
+        records = b"\n".join(
+            orjson.dumps({
+                "recordId": f"{index:08d}",
+                "modelInput": {
+                    "anthropic_version": "bedrock-2023-05-31",
+                    "max_tokens": max_tokens,
+                    "temperature": 0.3,
+                    "system": SYSTEM_PROMPT,
+                    "messages": [{"role": "user", "content": [{"type": "text", "text": prompt}]}]
+                }
+            })
+            for index, prompt in enumerate(prompts)
+        )
+        base_uri = f"s3://{bucket}/{prefix}".rstrip('/')
+        input_key = f"{prefix}/input/{job_name}.jsonl".lstrip('/')
+        get_aws_client('s3').put_object(Bucket=bucket, Key=input_key, Body=records)
+        
+        response = get_aws_client('bedrock').create_model_invocation_job(
+            jobName=job_name,
+            roleArn=parameters[BATCH_ROLE_ARN_PATH],
+            modelId=MODEL_ID,
+            inputDataConfig={"s3InputDataConfig": {"s3Uri": f"s3://{bucket}/{input_key}"}},
+            outputDataConfig={"s3OutputDataConfig": {"s3Uri": f"{base_uri}/output/"}}
+        )
+        logger.info(f"Submitted batch job {response['jobArn']} with {len(prompts)} prompts")
+        return response['jobArn']
+        
+    except Exception as e:
+        logger.error(f"Error submitting batch job: {e}")
+        raise
+
+def get_batch_results(job: dict) -> list:
+    """Read the per-record outputs of a finished batch job from S3."""
+    job_id = job['jobArn'].rsplit('/', 1)[-1]
+    bucket, prefix = _split_s3_uri(job['outputDataConfig']['s3OutputDataConfig']['s3Uri'])
+    output_prefix = f"{prefix}/{job_id}/".lstrip('/')
+    
+    results = []
+    paginator = get_aws_client('s3').get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=output_prefix):
+        for obj in page.get('Contents', []):
+            if not obj['Key'].endswith('.jsonl.out'):
+                continue
+            body = get_aws_client('s3').get_object(Bucket=bucket, Key=obj['Key'])['Body'].read()
+            for line in body.splitlines():
+                if not line:
+                    continue
+                record = orjson.loads(line)
+                output = record.get('modelOutput') or {}
+                results.append({
+                    "record_id": record.get('recordId'),
+                    "text": "".join(block.get('text', '') for block in output.get('content', [])),
+                    "error": record.get('error')
+                })
+    return sorted(results, key=lambda result: result['record_id'] or '')
+
+def handle_batch_request(payload: dict, owner: str) -> dict:
+    """
+    Handle a batch-eligible request for an authenticated user.
+    
+    Payload forms:
+        {"mode": "batch", "prompts": [...], "wait": false} - submit a job
+        {"mode": "batch", "job_arn": "..."} - check a job (results once finished)
+    
+    With "wait": true the job is polled every BATCH_POLL_INTERVAL_SECONDS until
+    it reaches a terminal status and the results are returned, or until
+    BATCH_WAIT_TIMEOUT_SECONDS pass, in which case the job ARN and its current
+    status are returned so the caller can check back later.
+    
+    Prompts must be a list of BATCH_MIN_RECORDS to BATCH_MAX_RECORDS non-empty
+    strings; anything else is rejected before anything is uploaded. Jobs can
+    only be read by the user who submitted them.
+    """
+    job_arn = payload.get("job_arn")
+    if not job_arn:
+        prompts = payload.get("prompts")
+        if not isinstance(prompts, list) or not prompts:
+            return {"error": "Batch requests need a non-empty list of prompts."}
+        if not all(isinstance(prompt, str) and prompt.strip() for prompt in prompts):
+            return {"error": "Every batch prompt must be a non-empty string."}
+        if not BATCH_MIN_RECORDS <= len(prompts) <= BATCH_MAX_RECORDS:
+            return {
+                "error": f"Batch requests need {BATCH_MIN_RECORDS} to {BATCH_MAX_RECORDS} prompts "
+                         f"(got {len(prompts)}); send smaller requests interactively."
+            }
+        job_arn = submit_batch_job(prompts, owner)
+        if not payload.get("wait"):
+            return {"job_arn": job_arn, "status": "Submitted"}
+    
+    deadline = time.monotonic() + BATCH_WAIT_TIMEOUT_SECONDS
+    try:
+        job = get_aws_client('bedrock').get_model_invocation_job(jobIdentifier=job_arn)
+    except Exception:
+        job = None
+    # Other users' jobs look the same as missing ones
+    if job is None or not job.get('jobName', '').startswith(_batch_job_prefix(owner)):
+        return {"error": "Batch job not found."}
+    while (payload.get("wait") and job['status'] not in BATCH_TERMINAL_STATUSES
+           and time.monotonic() < deadline):
+        time.sleep(BATCH_POLL_INTERVAL_SECONDS)
+        job = get_aws_client('bedrock').get_model_invocation_job(jobIdentifier=job_arn)
+    
+    response = {"job_arn": job_arn, "status": job['status']}
+    if job['status'] in ("Completed", "PartiallyCompleted"):
+        response["results"] = get_batch_results(job)
+    elif job.get('message'):
+        response["message"] = job['message']
+    return response
+
+_SESSION_DB = None
+_SESSION_DB_LOCK = threading.Lock()
+
+def resolve_session_id(customer_id, requested_session_id=None):
+    """
+    Choose the memory session for a customer and remember it for reconnects.
+    
+    An explicitly requested session ID wins and is stored; otherwise the
+    customer's last unexpired session is reused, falling back to the customer
+    ID itself. Lookups refresh the session's expiry.
+    
+    Args:
+        customer_id (str): The customer ID
+        requested_session_id (str): Session ID sent by the caller, if any
+        
+    Returns:
+        str: The session ID to use
+    """
+    global _SESSION_DB
+    if not customer_id:
+        return requested_session_id
+    
+    now = time.time()
+    try:
+        with _SESSION_DB_LOCK:
+            if _SESSION_DB is None:
+                _SESSION_DB = sqlite3.connect(SESSION_DB_PATH, check_same_thread=False)
+                _SESSION_DB.execute(
+                    "CREATE TABLE IF NOT EXISTS sessions ("
+                    "customer_id TEXT PRIMARY KEY, session_id TEXT NOT NULL, expires_at REAL NOT NULL)"
+                )
+            session_id = requested_session_id
+            if not session_id:
+                row = _SESSION_DB.execute(
+                    "SELECT session_id FROM sessions WHERE customer_id = ? AND expires_at > ?",
+                    (customer_id, now)
+                ).fetchone()
+                session_id = row[0] if row else customer_id
+            _SESSION_DB.execute(
+                "INSERT OR REPLACE INTO sessions (customer_id, session_id, expires_at) VALUES (?, ?, ?)",
+                (customer_id, session_id, now + SESSION_TTL_SECONDS)
+            )
+            _SESSION_DB.commit()
+            return session_id
+    except sqlite3.Error as e:
+        logger.warning("Session store unavailable, using default session: %s", e)
+        return requested_session_id or customer_id
+
+# Idle warm agents, checked out by one request at a time:
+# (customer_id, session_id) -> [(agent, mcp_client, memory_hooks, expires_at), ...]
+_AGENT_POOL = {}
+_AGENT_POOL_LOCK = threading.Lock()
+
+def _retire_agent(entry):
+    """Drop an agent for good: clear its conversation and close its memory hooks."""
+    agent, _, memory_hooks, _ = entry
+    agent.messages.clear()
+    memory_hooks.close()
+
+def checkout_agent(customer_id=None, session_id=None):
+    """
+    Take a warm agent for the customer's session out of the pool, creating one if none is idle.
+    
+    Strands agents can't serve two requests at once, so a checked-out agent
+    belongs to the caller until checkin_agent. Only the memory hooks are per
+    customer and session; the Gateway tools come from the shared MCP session.
+    An idle agent is rebuilt after AGENT_CACHE_TTL_SECONDS or when that session
+    is reconnected (Cognito token rotation). Anonymous requests (no customer_id)
+    always get a fresh agent.
+    
+    Args:
+        customer_id (str): The customer ID to use for memory context
+        session_id (str): The memory session ID for this request
+        
+    Returns:
+        tuple: (agent, mcp_client, memory_hooks, expires_at)
+    """
+    if not customer_id:
+        agent, mcp_client, memory_hooks = create_agent(customer_id=customer_id, session_id=session_id)
+        return agent, mcp_client, memory_hooks, 0.0
+    
+    session_id = session_id or customer_id
+    mcp_client, _ = get_gateway_tools()
+    now = time.monotonic()
+    reusable = None
+    retired = []
+    with _AGENT_POOL_LOCK:
+        idle = _AGENT_POOL.get((customer_id, session_id), [])
+        while idle and reusable is None:
+            entry = idle.pop()
+            if entry[1] is mcp_client and now < entry[3]:
+                reusable = entry
+            else:
+                retired.append(entry)
+        
+        # Retire expired agents so idle customers don't accumulate
+        for key in list(_AGENT_POOL):
+            live = []
+            for entry in _AGENT_POOL[key]:
+                (live if now < entry[3] else retired).append(entry)
+            if live:
+                _AGENT_POOL[key] = live
+            else:
+                del _AGENT_POOL[key]
+    
+    for entry in retired:
+        _retire_agent(entry)
+    if reusable is not None:
+        return reusable
+    
+    agent, mcp_client, memory_hooks = create_agent(customer_id=customer_id, session_id=session_id)
+    return agent, mcp_client, memory_hooks, now + AGENT_CACHE_TTL_SECONDS
+
+def checkin_agent(customer_id, session_id, entry):
+    """
+    Return a checked-out agent to the pool once its request is finished.
+    
+    The conversation is cleared so every request starts clean, exactly like a
+    freshly created agent; continuity across requests comes from AgentCore
+    Memory through the memory hooks.
+    
+    Args:
+        customer_id (str): The customer ID the agent was checked out for
+        session_id (str): The memory session ID it was checked out for
+        entry (tuple): The tuple returned by checkout_agent
+    """
+    entry[0].messages.clear()
+    if not customer_id or time.monotonic() >= entry[3]:
+        _retire_agent(entry)
+        return
+    with _GATEWAY_MCP_LOCK:
+        current_mcp_client = _GATEWAY_MCP[0] if _GATEWAY_MCP else None
+    if entry[1] is not current_mcp_client:
+        _retire_agent(entry)
+        return
+    with _AGENT_POOL_LOCK:
+        _AGENT_POOL.setdefault((customer_id, session_id or customer_id), []).append(entry)
+
+@atexit.register
+def close_gateway_clients():
+    """Retire pooled agents and close the Gateway MCP sessions when the container shuts down."""
+    with _AGENT_POOL_LOCK:
+        pooled = [entry for entries in _AGENT_POOL.values() for entry in entries]
+        _AGENT_POOL.clear()
+    for entry in pooled:
+        _retire_agent(entry)
+    for mcp_client in (_GATEWAY_MCP[0] if _GATEWAY_MCP else None, _RETIRED_MCP_CLIENT):
+        if mcp_client is not None:
+            try:
+                mcp_client.close()
+            except Exception:
+                pass
+
+async def stream_agent_response(entry, customer_id, session_id, user_input):
+    """
+    Yield the agent's response text as the model generates it.
+    
+    The agent streams on a worker thread with its own event loop, because its
+    memory hooks make blocking boto3 calls; chunks are handed back to the
+    runtime's loop through a queue. A failure mid-stream ends the stream with a
+    final "Error processing request: ..." chunk, the same text the
+    non-streaming path returns, instead of cutting the stream off.
+    
+    Args:
+        entry (tuple): The checked-out agent entry; it is checked back in when the stream ends
+        customer_id (str): The customer ID the agent was checked out for
+        session_id (str): The memory session ID it was checked out for
+        user_input (str): The user's input message
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    
+    async def produce():
+        async for event in entry[0].stream_async(user_input):
+            if "data" in event:
+                loop.call_soon_threadsafe(queue.put_nowait, ("data", event["data"]))
+    
+    def run():
+        try:
+            asyncio.run(produce())
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, ("error", e))
+        finally:
+            checkin_agent(customer_id, session_id, entry)
+            loop.call_soon_threadsafe(queue.put_nowait, ("done", None))
+    
+    loop.run_in_executor(None, run)
+    while True:
+        kind, value = await queue.get()
+        if kind == "data":
+            yield value
+        elif kind == "error":
+            logger.error(f"Error streaming response: {str(value)}")
+            yield f"Error processing request: {str(value)}"
+        else:
+            return
+
 # Initialize the AgentCore Runtime App
+def warm_start():
+    """Fill the SSM, Cognito token and Gateway MCP caches before the first request."""
+    try:
+        get_ssm_parameters(AGENT_PARAMETER_PATHS)
+        get_gateway_tools()
+        logger.info("Warm start complete")
+    except Exception as e:
+        logger.warning(f"Warm start failed, setup will run on first request: {e}")
+
 app = BedrockAgentCoreApp()
 
+if WARM_START:
+    # Runs alongside server startup; the first invoke waits on the same locks
+    _SETUP_EXECUTOR.submit(warm_start)
+
 @app.entrypoint
-def invoke(payload, user_id=None, context=None):
+async def invoke(payload, user_id=None, context=None):
     """
     AgentCore Runtime entrypoint function
     
     Args:
         payload (dict): The request payload containing:
             - prompt (str): The user's input message
+            - customerId (str, optional): The customer ID (otherwise mapped from user_id)
+            - sessionId (str, optional): Memory session to resume
+            - stream (bool, optional): Stream the response as it is generated
+            - mode (str, optional): "batch" to run prompts through Bedrock batch
+              inference (see handle_batch_request)
         user_id (str): The authenticated user ID from JWT token (may be None in local mode)
         context (dict): Request context containing headers and other info
             
     Returns:
-        str: The agent's response text
+        str: The agent's response text, or an async generator of text chunks
+        when streaming (served by the runtime as text/event-stream). Errors are
+        reported as "Error processing request: ..." text either way; a stream
+        that fails part-way ends with that text as its last chunk.
+        For batch requests, a dict with the job details or an "error" key.
     """
     # If user_id is None (local mode), try to extract from JWT token in context
     if user_id is None and context:
@@ -338,15 +928,28 @@ def invoke(payload, user_id=None, context=None):
         
         if auth_header and auth_header.startswith('Bearer '):
             token = auth_header[7:]  # Remove 'Bearer ' prefix
-            extracted_user_id = decode_jwt_token(token)
+            jwt_payload = decode_jwt_token(token)
+            # Keep the claims on the context so nothing downstream decodes the token again
+            context['jwt_payload'] = jwt_payload
+            # Extract user ID from 'sub' field
+            extracted_user_id = jwt_payload.get('sub') if jwt_payload else None
             if extracted_user_id:
                 user_id = extracted_user_id
-                logger.info(f"Extracted user_id from JWT token: {user_id}")
+                logger.info("Extracted user_id from JWT token: %s", user_id)
             else:
                 logger.warning("Failed to extract user_id from JWT token")
         else:
             logger.warning("No Authorization header found in context")
     
+    # Throughput-oriented work goes to Bedrock batch inference, not the live agent
+    if payload.get("mode") == "batch" or payload.get("batch_eligible"):
+        if not user_id:
+            return {"error": "Batch requests require an authenticated user."}
+        try:
+            return await asyncio.to_thread(handle_batch_request, payload, user_id)
+        except Exception as e:
+            logger.error(f"Error processing batch request: {str(e)}")
+            return {"error": f"Error processing batch request: {str(e)}"}
     
     user_input = payload.get("prompt", "")
     
@@ -355,28 +958,33 @@ def invoke(payload, user_id=None, context=None):
     
     try:
         # Check if customerId is provided in payload (from frontend)
-        payload_customer_id = payload.get("customerId")
-        if payload_customer_id:
-            customer_id = payload_customer_id
-        else:
-            # Map the authenticated user_id to the actual customer_id
-            customer_id = get_customer_id_from_user_id(user_id)
+        customer_id = payload.get("customerId") or None
+        if not customer_id and user_id:
+            # Map the authenticated user_id to the actual customer_id (unmapped users keep their ID)
+            customer_id = USER_CUSTOMER_MAPPING.get(user_id, user_id)
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("User mapping: %s -> %s", user_id, customer_id)
         
-        # Create the agent for this request with the mapped customer_id
-        agent, mcp_client = create_agent(customer_id=customer_id)
+        # Resume the customer's conversation session across reconnects
+        session_id = await asyncio.to_thread(resolve_session_id, customer_id, payload.get("sessionId"))
+        
+        # Check out a warm agent for this customer and session (or create one).
+        # Setup does blocking SSM/Cognito/MCP I/O, so keep it off the event loop.
+        entry = await asyncio.to_thread(checkout_agent, customer_id, session_id)
         
         # Log the customer ID being used
-        logger.info(f"Processing request for user: {user_id or 'anonymous'} -> customer: {customer_id or 'anonymous'}")
+        logger.info("Processing request for user: %s -> customer: %s", user_id or 'anonymous', customer_id or 'anonymous')
         
-        # Invoke the agent with the user input
-        response = agent(user_input)
+        # Stream tokens to the caller as they are decoded (the stream checks the agent back in)
+        if payload.get("stream"):
+            return stream_agent_response(entry, customer_id, session_id, user_input)
         
-        # Clean up the MCP client
+        # Invoke the agent with the user input (boto3 and memory hooks block too)
         try:
-            mcp_client.close()
-        except:
-            pass
-            
+            response = await asyncio.to_thread(entry[0], user_input)
+        finally:
+            checkin_agent(customer_id, session_id, entry)
+        
         return response.message["content"][0]["text"]
     except Exception as e:
         logger.error(f"Error processing request: {str(e)}")
@@ -6,12 +6,28 @@ This module provides memory hooks for conversation persistence and customer cont
 """
 
 import uuid
+import time
+import hashlib
 import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from bedrock_agentcore.memory import MemoryClient
 from strands.hooks import AfterInvocationEvent, MessageAddedEvent, HookProvider, HookRegistry
 
 logger = logging.getLogger(__name__)
 
+# Namespace lookups are independent RPCs - run them side by side (shared by all hooks)
+_RETRIEVAL_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="memory-retrieval")
+
+# Short-lived cache of retrieval results so repeated questions skip the RPC
+MEMORY_CACHE_TTL_SECONDS = 60
+MEMORY_CACHE_MAX_ENTRIES = 512
+
+# Memory strategy namespaces per memory_id -> (namespaces, expires_at); they rarely change
+_NAMESPACE_CACHE = {}
+NAMESPACE_CACHE_TTL_SECONDS = 6 * 3600
+
 class CustomerRetentionMemoryHooks(HookProvider):
     """Memory hooks for Customer Retention Agent"""
     
@@ -20,60 +36,97 @@ class CustomerRetentionMemoryHooks(HookProvider):
         self.customer_id = customer_id or "default-customer"
         self.session_id = session_id or str(uuid.uuid4())
         self.memory_client = MemoryClient(region_name=region)
+        # (namespace, query digest, top_k) -> (memories, expires_at); filled from retrieval threads
+        self._memory_cache = OrderedDict()
+        self._memory_cache_lock = threading.Lock()
         
-        # Get memory strategies and namespaces
+        # Get memory strategies and namespaces (shared by every hook for this memory)
+        cached = _NAMESPACE_CACHE.get(memory_id)
+        if cached and time.monotonic() < cached[1]:
+            self.namespaces = cached[0]
+        else:
+            self.namespaces = self._load_namespaces()
+
+        # customer_id is fixed for the hook, so format each namespace once
+        self._formatted_namespaces = [
+            (context_type, namespace.format(actorId=self.customer_id))
+            for context_type, namespace in self.namespaces.items()
+        ]
+
+    def _load_namespaces(self):
+        """Load namespaces from the memory strategies, caching them per memory_id"""
         try:
             strategies = self.memory_client.get_memory_strategies(self.memory_id)
-            self.namespaces = {
+            namespaces = {
                 strategy["type"]: strategy["namespaces"][0]
                 for strategy in strategies
             }
-            logger.info(f"✅ Memory namespaces loaded: {list(self.namespaces.keys())}")
+            _NAMESPACE_CACHE[self.memory_id] = (namespaces, time.monotonic() + NAMESPACE_CACHE_TTL_SECONDS)
+            logger.info(f"✅ Memory namespaces loaded: {list(namespaces.keys())}")
+            return namespaces
         except Exception as e:
             logger.error(f"Error loading memory strategies: {e}")
-            self.namespaces = {
+            return {
                 "USER_PREFERENCE": "retention/customer/{actorId}/preferences",
                 "SEMANTIC": "retention/customer/{actorId}/semantic"
             }
     
+    def _retrieve_context(self, query: str, top_k: int):
+        """Retrieve memories from every namespace concurrently, as tagged context strings"""
+        query_digest = hashlib.blake2b(query.encode(), digest_size=16).digest()
+
+        def retrieve(namespace):
+            key = (namespace, query_digest, top_k)
+            with self._memory_cache_lock:
+                cached = self._memory_cache.get(key)
+            if cached and time.monotonic() < cached[1]:
+                return cached[0]
+
+            memories = self.memory_client.retrieve_memories(
+                memory_id=self.memory_id,
+                namespace=namespace,
+                query=query,
+                top_k=top_k,
+            )
+            with self._memory_cache_lock:
+                self._memory_cache.pop(key, None)
+                while len(self._memory_cache) >= MEMORY_CACHE_MAX_ENTRIES:
+                    self._memory_cache.popitem(last=False)  # Evict the oldest entry
+                self._memory_cache[key] = (memories, time.monotonic() + MEMORY_CACHE_TTL_SECONDS)
+            return memories
+
+        all_context = []
+        results = _RETRIEVAL_EXECUTOR.map(retrieve, [namespace for _, namespace in self._formatted_namespaces])
+        for (context_type, _), memories in zip(self._formatted_namespaces, results):
+            tag = f"[{context_type.upper()}]"
+            # Format memories into context strings, skipping malformed records
+            for memory in memories:
+                try:
+                    text = memory["content"]["text"].strip()
+                except (KeyError, TypeError, AttributeError):
+                    continue
+                if text:
+                    all_context.append(f"{tag} {text}")
+        return all_context
+
     def retrieve_customer_context(self, event: MessageAddedEvent):
         """Retrieve customer context before processing retention query"""
-        messages = event.agent.messages
-        if (
-            messages[-1]["role"] == "user"
-            and "toolResult" not in messages[-1]["content"][0]
-        ):
-            user_query = messages[-1]["content"][0]["text"]
+        last_message = event.agent.messages[-1]
+        if last_message["role"] != "user":
+            return
 
-            try:
-                all_context = []
+        first_block = last_message["content"][0]
+        if "toolResult" not in first_block:
+            user_query = first_block["text"]
 
-                for context_type, namespace in self.namespaces.items():
-                    # Retrieve customer context from each namespace
-                    memories = self.memory_client.retrieve_memories(
-                        memory_id=self.memory_id,
-                        namespace=namespace.format(actorId=self.customer_id),
-                        query=user_query,
-                        top_k=3,
-                    )
-                    # Format memories into context strings
-                    for memory in memories:
-                        if isinstance(memory, dict):
-                            content = memory.get("content", {})
-                            if isinstance(content, dict):
-                                text = content.get("text", "").strip()
-                                if text:
-                                    all_context.append(
-                                        f"[{context_type.upper()}] {text}"
-                                    )
+            try:
+                # Retrieve customer context from each namespace
+                all_context = self._retrieve_context(user_query, top_k=3)
 
                 # Inject customer context into the query
                 if all_context:
                     context_text = "\n".join(all_context)
-                    original_text = messages[-1]["content"][0]["text"]
-                    messages[-1]["content"][0][
-                        "text"
-                    ] = f"Customer Context:\n{context_text}\n\n{original_text}"
+                    first_block["text"] = f"Customer Context:\n{context_text}\n\n{user_query}"
                     logger.info(f"Retrieved {len(all_context)} customer context items")
 
             except Exception as e:
@@ -84,19 +137,15 @@ class CustomerRetentionMemoryHooks(HookProvider):
         try:
             messages = event.agent.messages
             if len(messages) >= 2 and messages[-1]["role"] == "assistant":
-                # Get last customer query and agent response
+                # The last message is the agent response; walk back to the customer query
+                agent_response = messages[-1]["content"][0]["text"]
                 customer_query = None
-                agent_response = None
-
-                for msg in reversed(messages):
-                    if msg["role"] == "assistant" and not agent_response:
-                        agent_response = msg["content"][0]["text"]
-                    elif (
-                        msg["role"] == "user"
-                        and not customer_query
-                        and "toolResult" not in msg["content"][0]
-                    ):
-                        customer_query = msg["content"][0]["text"]
+
+                for i in range(len(messages) - 2, -1, -1):
+                    msg = messages[i]
+                    first_block = msg["content"][0]
+                    if msg["role"] == "user" and "toolResult" not in first_block:
+                        customer_query = first_block["text"]
                         break
 
                 if customer_query and agent_response:
@@ -121,28 +170,16 @@ class CustomerRetentionMemoryHooks(HookProvider):
         registry.add_callback(AfterInvocationEvent, self.save_retention_interaction)
         logger.info("Customer retention memory hooks registered")
     
+    def close(self):
+        """Release the hook's retrieval cache and Memory client once its agent is retired"""
+        with self._memory_cache_lock:
+            self._memory_cache.clear()
+        self.memory_client = None
+
     def get_customer_context(self):
         """Get customer-specific context from memory"""
         try:
-            all_context = []
-            
-            for context_type, namespace in self.namespaces.items():
-                memories = self.memory_client.retrieve_memories(
-                    memory_id=self.memory_id,
-                    namespace=namespace.format(actorId=self.customer_id),
-                    query="customer preferences and retention history",
-                    top_k=5
-                )
-                
-                for memory in memories:
-                    if isinstance(memory, dict):
-                        content = memory.get("content", {})
-                        if isinstance(content, dict):
-                            text = content.get("text", "").strip()
-                            if text:
-                                all_context.append(f"[{context_type.upper()}] {text}")
-            
-            return all_context
+            return self._retrieve_context("customer preferences and retention history", top_k=5)
         except Exception as e:
             logger.error(f"Error getting customer context: {e}")
             return []
@@ -10,6 +10,11 @@ import os
 import sys
 import boto3
 import json
+from functools import lru_cache
+from dataclasses import dataclass, field
+from typing import Any, Dict
+from concurrent.futures import ThreadPoolExecutor
+from botocore.config import Config
 from botocore.exceptions import ClientError
 
 # Configure logging
@@ -19,109 +24,147 @@ logger = logging.getLogger(__name__)
 
 # AWS Configuration
 REGION = os.environ.get('AWS_DEFAULT_REGION', 'us-east-1')
-ACCOUNT_ID = boto3.client('sts').get_caller_identity()['Account']
+SESSION = boto3.Session(region_name=REGION)
+# Same client settings as create_gateway.py
+_CFG = Config(
+    tcp_keepalive=True,
+    max_pool_connections=16,
+    retries={'mode': 'adaptive', 'max_attempts': 8}
+)
 
-def get_ssm_parameter(parameter_name: str) -> str:
-    """Get parameter value from SSM Parameter Store"""
+# Parameter Store Paths
+GATEWAY_ID_PATH = '/customer-retention-agent/gateway/id'
+
+@lru_cache(maxsize=None)
+def _client(service_name: str):
+    """Return the shared client for a service, built once per run"""
+    return SESSION.client(service_name, region_name=REGION, config=_CFG)
+
+@lru_cache(maxsize=None)
+def get_account_id() -> str:
+    """Look up the AWS account ID (only when a Lambda ARN is needed)"""
+    return _client('sts').get_caller_identity()['Account']
+
+@lru_cache(maxsize=None)
+def get_ssm_parameter(parameter_name: str, with_decryption: bool = False) -> str:
+    """Get parameter value from SSM Parameter Store (cached for the run; decrypt SecureStrings only)"""
     try:
-        ssm_client = boto3.client('ssm', region_name=REGION)
-        response = ssm_client.get_parameter(Name=parameter_name, WithDecryption=True)
+        response = _client('ssm').get_parameter(Name=parameter_name, WithDecryption=with_decryption)
         return response['Parameter']['Value']
     except ClientError as e:
         logger.error(f"Error getting SSM parameter {parameter_name}: {str(e)}")
         raise
 
-def get_lambda_tool_schemas():
-    """Define tool schemas for our Lambda functions"""
-    return [
-        {
-            "name": "web_search",
-            "description": "Search the web for updated information using DuckDuckGo",
-            "inputSchema": {
-                "type": "object",
-                "properties": {
-                    "keywords": {
-                        "type": "string",
-                        "description": "The search query keywords"
-                    },
-                    "region": {
-                        "type": "string",
-                        "description": "The search region (e.g., us-en, uk-en, ru-ru)"
-                    },
-                    "max_results": {
-                        "type": "integer",
-                        "description": "The maximum number of results to return"
-                    }
+# Tool schemas for our Lambda functions (read-only; boto3 serializes them per request)
+_TOOL_SCHEMAS = [
+    {
+        "name": "web_search",
+        "description": "Search the web for updated information using DuckDuckGo",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "keywords": {
+                    "type": "string",
+                    "description": "The search query keywords"
                 },
-                "required": ["keywords"]
-            }
-        },
-        {
-            "name": "churn_data_query",
-            "description": "Query customer churn data and risk analysis from Athena",
-            "inputSchema": {
-                "type": "object",
-                "properties": {
-                    "customer_id": {
-                        "type": "string",
-                        "description": "The customer ID to query churn data for"
-                    }
+                "region": {
+                    "type": "string",
+                    "description": "The search region (e.g., us-en, uk-en, ru-ru)"
                 },
-                "required": ["customer_id"]
-            }
-        },
-        {
-            "name": "retention_offer",
-            "description": "Generate personalized retention offers based on customer risk",
-            "inputSchema": {
-                "type": "object",
-                "properties": {
-                    "customer_id": {
-                        "type": "string",
-                        "description": "The customer ID to generate offers for"
-                    },
-                    "churn_data": {
-                        "type": "object",
-                        "description": "Complete churn analysis data from churn_data_query",
-                        "properties": {
-                            "churn_analysis": {
-                                "type": "object",
-                                "properties": {
-                                    "risk_level": {"type": "string"},
-                                    "churn_risk_score": {"type": "number"}
-                                }
-                            },
-                            "customer_profile": {
-                                "type": "object",
-                                "properties": {
-                                    "monthly_charges": {"type": "number"},
-                                    "tenure_months": {"type": "number"},
-                                    "contract_type": {"type": "string"}
-                                }
+                "max_results": {
+                    "type": "integer",
+                    "description": "The maximum number of results to return"
+                }
+            },
+            "required": ["keywords"]
+        }
+    },
+    {
+        "name": "churn_data_query",
+        "description": "Query customer churn data and risk analysis from Athena",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "customer_id": {
+                    "type": "string",
+                    "description": "The customer ID to query churn data for"
+                }
+            },
+            "required": ["customer_id"]
+        }
+    },
+    {
+        "name": "retention_offer",
+        "description": "Generate personalized retention offers based on customer risk",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "customer_id": {
+                    "type": "string",
+                    "description": "The customer ID to generate offers for"
+                },
+                "churn_data": {
+                    "type": "object",
+                    "description": "Complete churn analysis data from churn_data_query",
+                    "properties": {
+                        "churn_analysis": {
+                            "type": "object",
+                            "properties": {
+                                "risk_level": {"type": "string"},
+                                "churn_risk_score": {"type": "number"}
+                            }
+                        },
+                        "customer_profile": {
+                            "type": "object",
+                            "properties": {
+                                "monthly_charges": {"type": "number"},
+                                "tenure_months": {"type": "number"},
+                                "contract_type": {"type": "string"}
                             }
                         }
                     }
-                },
-                "required": ["customer_id", "churn_data"]
-            }
+                }
+            },
+            "required": ["customer_id", "churn_data"]
         }
-    ]
+    }
+]
+
+# Per-target inline payloads, built once and passed by reference
+_TOOL_PAYLOADS = {
+    'WebSearchTarget': (_TOOL_SCHEMAS[0],),  # web_search
+    'ChurnDataQueryTarget': (_TOOL_SCHEMAS[1],),  # churn_data_query
+    'RetentionOfferTarget': (_TOOL_SCHEMAS[2],),  # retention_offer
+}
+
+def get_lambda_tool_schemas():
+    """Define tool schemas for our Lambda functions"""
+    return _TOOL_SCHEMAS
+
+@dataclass
+class GatewayContext:
+    """Gateway client, ID and a snapshot of existing targets shared by every target call"""
+    client: Any
+    gateway_id: str
+    existing: Dict[str, str] = field(default_factory=dict)
+
+def list_gateway_targets(client, gateway_id: str) -> Dict[str, str]:
+    """Map target name to target ID for every target on the Gateway"""
+    existing = {}
+    paginator = client.get_paginator('list_gateway_targets')
+    for page in paginator.paginate(gatewayIdentifier=gateway_id):
+        # The API returns targets under 'items'; 'gatewayTargets' is kept for older SDK models
+        for target in page.get('items', page.get('gatewayTargets', [])):
+            existing[target.get('name')] = target['targetId']
+    return existing
 
-def create_gateway_target(gateway_id: str, target_name: str, lambda_arn: str, tool_schemas: list):
+def create_gateway_target(ctx: GatewayContext, target_name: str, lambda_arn: str, tool_schemas: tuple):
     """Create a Gateway target for a Lambda function"""
     try:
-        gateway_client = boto3.client('bedrock-agentcore-control', region_name=REGION)
-        
-        # Check if target already exists
-        try:
-            response = gateway_client.list_gateway_targets(gatewayIdentifier=gateway_id)
-            for target in response.get('gatewayTargets', []):
-                if target['name'] == target_name:
-                    logger.info(f"✅ Gateway target already exists: {target['targetId']}")
-                    return target['targetId']
-        except Exception as e:
-            logger.info(f"Could not check existing targets: {str(e)}")
-            # Continue to create new target
+        # Targets from the snapshot taken at startup need no API call
+        if target_name in ctx.existing:
+            logger.info(f"✅ Gateway target already exists: {ctx.existing[target_name]}")
+            return ctx.existing[target_name]
         
         # Lambda target configuration
         lambda_target_config = {
@@ -142,8 +185,8 @@ def create_gateway_target(gateway_id: str, target_name: str, lambda_arn: str, to
         
         # Create the target
         try:
-            create_response = gateway_client.create_gateway_target(
-                gatewayIdentifier=gateway_id,
+            create_response = ctx.client.create_gateway_target(
+                gatewayIdentifier=ctx.gateway_id,
                 name=target_name,
                 description=f"Lambda target for {target_name} function",
                 targetConfiguration=lambda_target_config,
@@ -157,26 +200,16 @@ def create_gateway_target(gateway_id: str, target_name: str, lambda_arn: str, to
             
         except ClientError as e:
             if e.response['Error']['Code'] == 'ConflictException':
-                # Target already exists, get its ID
+                # Target was created after the snapshot was taken, get its ID
                 logger.info(f"Target {target_name} already exists, getting existing target ID...")
-                try:
-                    response = gateway_client.list_gateway_targets(gatewayIdentifier=gateway_id)
-                    logger.info(f"Found {len(response.get('gatewayTargets', []))} existing targets")
-                    for target in response.get('gatewayTargets', []):
-                        logger.info(f"Checking target: {target.get('name', 'NO_NAME')}")
-                        if target.get('name') == target_name:
-                            logger.info(f"✅ Using existing Gateway target: {target['targetId']}")
-                            return target['targetId']
-                    
-                    # If we still can't find it, let's try a different approach
-                    logger.warning(f"Could not find target {target_name} in list, but it exists. This might be a timing issue.")
-                    logger.info("Skipping this target and continuing with others...")
-                    return None
-                    
-                except Exception as list_error:
-                    logger.error(f"Error listing targets: {str(list_error)}")
-                    logger.info("Skipping this target and continuing with others...")
-                    return None
+                target_id = list_gateway_targets(ctx.client, ctx.gateway_id).get(target_name)
+                if target_id:
+                    logger.info(f"✅ Using existing Gateway target: {target_id}")
+                    return target_id
+                
+                # A conflict with no target of this name is not a duplicate; let it surface
+                logger.error(f"Conflict creating {target_name}, but no target with that name exists")
+                raise
             else:
                 raise
         
@@ -188,42 +221,41 @@ def attach_all_lambda_targets():
     """Attach all 3 Lambda functions as Gateway targets"""
     try:
         # Get Gateway configuration
-        gateway_id = get_ssm_parameter('/customer-retention-agent/gateway/id')
+        gateway_id = get_ssm_parameter(GATEWAY_ID_PATH)
         logger.info(f"Using Gateway ID: {gateway_id}")
         
-        # Get tool schemas
-        tool_schemas = get_lambda_tool_schemas()
-        
         # Lambda function ARNs
+        account_id = get_account_id()
         lambda_functions = {
             'WebSearchTarget': {
-                'arn': f'arn:aws:lambda:{REGION}:{ACCOUNT_ID}:function:dev-customer-retention-web-search',
-                'tools': [tool_schemas[0]]  # web_search
+                'arn': f'arn:aws:lambda:{REGION}:{account_id}:function:dev-customer-retention-web-search',
+                'tools': _TOOL_PAYLOADS['WebSearchTarget']
             },
             'ChurnDataQueryTarget': {
-                'arn': f'arn:aws:lambda:{REGION}:{ACCOUNT_ID}:function:dev-customer-retention-churn-data-query',
-                'tools': [tool_schemas[1]]  # churn_data_query
+                'arn': f'arn:aws:lambda:{REGION}:{account_id}:function:dev-customer-retention-churn-data-query',
+                'tools': _TOOL_PAYLOADS['ChurnDataQueryTarget']
             },
             'RetentionOfferTarget': {
-                'arn': f'arn:aws:lambda:{REGION}:{ACCOUNT_ID}:function:dev-customer-retention-retention-offer',
-                'tools': [tool_schemas[2]]  # retention_offer
+                'arn': f'arn:aws:lambda:{REGION}:{account_id}:function:dev-customer-retention-retention-offer',
+                'tools': _TOOL_PAYLOADS['RetentionOfferTarget']
             }
         }
         
         target_ids = {}
         
-        # Create targets for each Lambda function
+        # One listing up front tells every target call what already exists
+        gateway_client = _client('bedrock-agentcore-control')
+        ctx = GatewayContext(gateway_client, gateway_id, list_gateway_targets(gateway_client, gateway_id))
+        
+        # Create targets one at a time: concurrent updates to the same Gateway
+        # conflict with each other and would be mistaken for existing targets
         for target_name, config in lambda_functions.items():
-            target_id = create_gateway_target(
-                gateway_id=gateway_id,
+            target_ids[target_name] = create_gateway_target(
+                ctx,
                 target_name=target_name,
                 lambda_arn=config['arn'],
                 tool_schemas=config['tools']
             )
-            if target_id:  # Only store if we got a valid target ID
-                target_ids[target_name] = target_id
-            else:
-                logger.warning(f"Skipping {target_name} due to existing target issues")
         
         logger.info("🎉 All Lambda targets attached successfully!")
         logger.info(f"Target IDs: {target_ids}")
@@ -237,9 +269,12 @@ def attach_all_lambda_targets():
 def store_target_config(target_ids: dict):
     """Store target configuration in SSM Parameter Store"""
     try:
-        ssm_client = boto3.client('ssm', region_name=REGION)
+        if not target_ids:
+            return
+        
+        ssm_client = _client('ssm')
         
-        for target_name, target_id in target_ids.items():
+        def put_target_id(target_name, target_id):
             parameter_name = f'/customer-retention-agent/gateway/targets/{target_name.lower()}'
             ssm_client.put_parameter(
                 Name=parameter_name,
@@ -252,6 +287,12 @@ def store_target_config(target_ids: dict):
                 ]
             )
         
+        # SSM has no batch put - issue the writes concurrently instead
+        with ThreadPoolExecutor(max_workers=len(target_ids)) as executor:
+            futures = [executor.submit(put_target_id, name, target_id) for name, target_id in target_ids.items()]
+        for future in futures:
+            future.result()  # Re-raise the first failure
+        
         logger.info("✅ Target configuration stored in SSM Parameter Store")
         
     except Exception as e:
@@ -263,6 +304,18 @@ def main():
     try:
         logger.info("🚀 Starting Lambda target attachment to Gateway...")
         
+        # Warm the memoized gateway ID and account ID lookups side by side
+        # (clients first - creating clients from a session is not thread-safe)
+        _client('ssm')
+        _client('sts')
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            lookups = [
+                executor.submit(get_ssm_parameter, GATEWAY_ID_PATH),
+                executor.submit(get_account_id)
+            ]
+        for lookup in lookups:
+            lookup.result()
+        
         # Attach all Lambda targets
         target_ids = attach_all_lambda_targets()
         
@@ -10,6 +10,11 @@ import boto3
 import os
 import logging
 import json
+import hashlib
+from functools import lru_cache
+from string import Template
+from concurrent.futures import ThreadPoolExecutor
+from botocore.config import Config
 from botocore.exceptions import ClientError
 
 # Configure logging
@@ -18,9 +23,18 @@ logger = logging.getLogger(__name__)
 
 # AWS Configuration
 REGION = os.environ.get('AWS_DEFAULT_REGION', 'us-east-1')
-SSM_CLIENT = boto3.client('ssm', region_name=REGION)
-IAM_CLIENT = boto3.client('iam', region_name=REGION)
-GATEWAY_CLIENT = boto3.client('bedrock-agentcore-control', region_name=REGION)
+SESSION = boto3.Session(region_name=REGION)
+# Keep connections alive between the control-plane calls. Adaptive retries add
+# client-side rate limiting on top of jittered backoff, so concurrent runs back off
+# under throttling instead of amplifying it the way legacy retries do.
+_CFG = Config(
+    tcp_keepalive=True,
+    max_pool_connections=16,
+    retries={'mode': 'adaptive', 'max_attempts': 8}
+)
+SSM_CLIENT = SESSION.client('ssm', region_name=REGION, config=_CFG)
+IAM_CLIENT = SESSION.client('iam', region_name=REGION, config=_CFG)
+GATEWAY_CLIENT = SESSION.client('bedrock-agentcore-control', region_name=REGION, config=_CFG)
 
 # Parameter Store Paths
 COGNITO_USER_POOL_ID_PATH = "/customer-retention-agent/cognito/user-pool-id"
@@ -29,24 +43,33 @@ COGNITO_M2M_CLIENT_SECRET_PATH = "/customer-retention-agent/cognito/m2m-client-s
 COGNITO_DISCOVERY_URL_PATH = "/customer-retention-agent/cognito/discovery-url"
 COGNITO_AUTH_SCOPE_PATH = "/customer-retention-agent/cognito/auth-scope"
 
+# Cognito settings the Gateway authorizer is built from
+GATEWAY_AUTH_PARAMETER_PATHS = [COGNITO_USER_POOL_ID_PATH, COGNITO_M2M_CLIENT_ID_PATH, COGNITO_DISCOVERY_URL_PATH]
+
 GATEWAY_ID_PATH = "/customer-retention-agent/gateway/id"
 GATEWAY_URL_PATH = "/customer-retention-agent/gateway/url"
 
 # Gateway Configuration
 GATEWAY_NAME = "customer-retention-gateway"
 GATEWAY_IAM_ROLE_NAME = "CustomerRetentionGatewayRole"
+POLICY_HASH_TAG = "policy-hash"
+
+@lru_cache(maxsize=1)
+def get_account_id() -> str:
+    """Look up the AWS account ID once, only when a Lambda ARN is needed."""
+    return SESSION.client('sts', region_name=REGION, config=_CFG).get_caller_identity()['Account']
 
-def get_ssm_parameter(name: str) -> str:
-    """Retrieve a parameter from SSM Parameter Store."""
+def get_ssm_parameters(names: list, with_decryption: bool = False) -> dict:
+    """Retrieve several parameters from SSM Parameter Store in one call."""
     try:
-        response = SSM_CLIENT.get_parameter(Name=name, WithDecryption=True)
-        return response['Parameter']['Value']
+        response = SSM_CLIENT.get_parameters(Names=list(names), WithDecryption=with_decryption)
     except ClientError as e:
-        if e.response['Error']['Code'] == 'ParameterNotFound':
-            logger.error(f"SSM parameter '{name}' not found. Please create it.")
-        else:
-            logger.error(f"Error retrieving SSM parameter '{name}': {e}")
+        logger.error(f"Error retrieving SSM parameters {names}: {e}")
         raise
+    if response.get('InvalidParameters'):
+        logger.error(f"SSM parameters not found: {response['InvalidParameters']}. Please create them.")
+        raise ValueError(f"SSM parameters not found: {response['InvalidParameters']}")
+    return {parameter['Name']: parameter['Value'] for parameter in response['Parameters']}
 
 def put_ssm_parameter(name: str, value: str, description: str, overwrite: bool = True):
     """Store a parameter in SSM Parameter Store."""
@@ -64,66 +87,83 @@ def put_ssm_parameter(name: str, value: str, description: str, overwrite: bool =
         logger.error(f"Error storing SSM parameter '{name}': {e}")
         raise
 
+# Trust policy for Bedrock AgentCore (static, serialized once)
+_TRUST_POLICY_JSON = json.dumps({
+    "Version": "2012-10-17",
+    "Statement": [
+        {
+            "Effect": "Allow",
+            "Principal": {
+                "Service": "bedrock-agentcore.amazonaws.com"
+            },
+            "Action": "sts:AssumeRole"
+        }
+    ]
+}, separators=(',', ':'))
+
+# Lambda invocation policy; only the region and account vary ($-placeholders can't clash with JSON braces)
+_INVOKE_LAMBDA_POLICY_TEMPLATE = Template(json.dumps({
+    "Version": "2012-10-17",
+    "Statement": [
+        {
+            "Effect": "Allow",
+            "Action": [
+                "lambda:InvokeFunction"
+            ],
+            "Resource": [
+                "arn:aws:lambda:${region}:${account}:function:dev-customer-retention-web-search",
+                "arn:aws:lambda:${region}:${account}:function:dev-customer-retention-churn-data-query",
+                "arn:aws:lambda:${region}:${account}:function:dev-customer-retention-retention-offer"
+            ]
+        }
+    ]
+}, separators=(',', ':')))
+
 def create_gateway_iam_role() -> str:
-    """Create or get the IAM role for the AgentCore Gateway."""
+    """Create or get the IAM role for the AgentCore Gateway, keeping its invoke policy current."""
     try:
+        # The tag on the role records which policy document was last attached
+        policy_document = _INVOKE_LAMBDA_POLICY_TEMPLATE.substitute(region=REGION, account=get_account_id())
+        policy_hash = hashlib.sha256(policy_document.encode()).hexdigest()[:16]
+
         # Check if role already exists
+        role_arn = None
         try:
-            role = IAM_CLIENT.get_role(RoleName=GATEWAY_IAM_ROLE_NAME)
-            logger.info(f"✅ IAM role '{GATEWAY_IAM_ROLE_NAME}' already exists: {role['Role']['Arn']}")
-            return role['Role']['Arn']
+            role = IAM_CLIENT.get_role(RoleName=GATEWAY_IAM_ROLE_NAME)['Role']
+            role_arn = role['Arn']
+            tags = {tag['Key']: tag['Value'] for tag in role.get('Tags', [])}
+            if tags.get(POLICY_HASH_TAG) == policy_hash:
+                logger.info(f"✅ IAM role '{GATEWAY_IAM_ROLE_NAME}' already exists: {role_arn}")
+                return role_arn
+            logger.info(f"IAM role '{GATEWAY_IAM_ROLE_NAME}' exists but its policy is out of date, updating")
         except ClientError as e:
             if e.response['Error']['Code'] != 'NoSuchEntity':
                 raise # Re-raise if it's not a "not found" error
 
-        logger.info(f"Creating IAM role: {GATEWAY_IAM_ROLE_NAME}")
-
-        # Trust policy for Bedrock AgentCore
-        trust_policy = {
-            "Version": "2012-10-17",
-            "Statement": [
-                {
-                    "Effect": "Allow",
-                    "Principal": {
-                        "Service": "bedrock-agentcore.amazonaws.com"
-                    },
-                    "Action": "sts:AssumeRole"
-                }
-            ]
-        }
+        if role_arn is None:
+            logger.info(f"Creating IAM role: {GATEWAY_IAM_ROLE_NAME}")
 
-        create_role_response = IAM_CLIENT.create_role(
-            RoleName=GATEWAY_IAM_ROLE_NAME,
-            AssumeRolePolicyDocument=json.dumps(trust_policy),
-            Description="IAM role for Customer Retention AgentCore Gateway to invoke Lambda functions",
-            Tags=[{'Key': 'project', 'Value': 'customer-retention-agent'}, {'Key': 'component', 'Value': 'gateway'}]
-        )
-        role_arn = create_role_response['Role']['Arn']
-        logger.info(f"✅ IAM role '{GATEWAY_IAM_ROLE_NAME}' created with ARN: {role_arn}")
+            create_role_response = IAM_CLIENT.create_role(
+                RoleName=GATEWAY_IAM_ROLE_NAME,
+                AssumeRolePolicyDocument=_TRUST_POLICY_JSON,
+                Description="IAM role for Customer Retention AgentCore Gateway to invoke Lambda functions",
+                Tags=[{'Key': 'project', 'Value': 'customer-retention-agent'}, {'Key': 'component', 'Value': 'gateway'}]
+            )
+            role_arn = create_role_response['Role']['Arn']
+            logger.info(f"✅ IAM role '{GATEWAY_IAM_ROLE_NAME}' created with ARN: {role_arn}")
 
         # Attach policy for Lambda invocation
         # This policy grants permission to invoke *all* Lambda functions.
         # In a production environment, you would restrict this to specific Lambda ARNs.
-        invoke_lambda_policy = {
-            "Version": "2012-10-17",
-            "Statement": [
-                {
-                    "Effect": "Allow",
-                    "Action": [
-                        "lambda:InvokeFunction"
-                    ],
-                    "Resource": [
-                        f"arn:aws:lambda:{REGION}:{boto3.client('sts').get_caller_identity()['Account']}:function:dev-customer-retention-web-search",
-                        f"arn:aws:lambda:{REGION}:{boto3.client('sts').get_caller_identity()['Account']}:function:dev-customer-retention-churn-data-query",
-                        f"arn:aws:lambda:{REGION}:{boto3.client('sts').get_caller_identity()['Account']}:function:dev-customer-retention-retention-offer"
-                    ]
-                }
-            ]
-        }
         IAM_CLIENT.put_role_policy(
             RoleName=GATEWAY_IAM_ROLE_NAME,
             PolicyName="CustomerRetentionGatewayLambdaInvokePolicy",
-            PolicyDocument=json.dumps(invoke_lambda_policy)
+            PolicyDocument=policy_document
+        )
+        # Tag only after the policy is in place, so a failed put is retried next run
+        IAM_CLIENT.tag_role(
+            RoleName=GATEWAY_IAM_ROLE_NAME,
+            Tags=[{'Key': POLICY_HASH_TAG, 'Value': policy_hash}]
         )
         logger.info(f"✅ Attached Lambda invocation policy to '{GATEWAY_IAM_ROLE_NAME}'")
 
@@ -133,27 +173,16 @@ def create_gateway_iam_role() -> str:
         logger.error(f"Error creating/getting Gateway IAM role: {e}")
         raise
 
-def create_agentcore_gateway(gateway_iam_role_arn: str) -> tuple[str, str]:
-    """Create or get the AgentCore Gateway."""
+def create_agentcore_gateway(gateway_iam_role_arn: str, cognito_parameters: dict = None) -> tuple[str, str]:
+    """Create or get the AgentCore Gateway (cognito_parameters may be prefetched by the caller)."""
     try:
-        # Check if gateway already exists
-        try:
-            response = GATEWAY_CLIENT.list_gateways(nameContains=GATEWAY_NAME)
-            for gw in response.get('gateways', []):
-                if gw['name'] == GATEWAY_NAME:
-                    logger.info(f"✅ AgentCore Gateway '{GATEWAY_NAME}' already exists: {gw['gatewayId']}")
-                    return gw['gatewayId'], gw['gatewayUrl']
-            
-        except ClientError as e:
-            if e.response['Error']['Code'] != 'ResourceNotFoundException':
-                raise # Re-raise if it's not a "not found" error
-
         logger.info(f"Creating AgentCore Gateway: {GATEWAY_NAME}")
 
-        # Retrieve Cognito parameters
-        user_pool_id = get_ssm_parameter(COGNITO_USER_POOL_ID_PATH)
-        m2m_client_id = get_ssm_parameter(COGNITO_M2M_CLIENT_ID_PATH)
-        discovery_url = get_ssm_parameter(COGNITO_DISCOVERY_URL_PATH)
+        # Retrieve Cognito parameters in a single GetParameters call
+        if cognito_parameters is None:
+            cognito_parameters = get_ssm_parameters(GATEWAY_AUTH_PARAMETER_PATHS)
+        m2m_client_id = cognito_parameters[COGNITO_M2M_CLIENT_ID_PATH]
+        discovery_url = cognito_parameters[COGNITO_DISCOVERY_URL_PATH]
 
         auth_config = {
             "customJWTAuthorizer": {
@@ -162,15 +191,29 @@ def create_agentcore_gateway(gateway_iam_role_arn: str) -> tuple[str, str]:
             }
         }
 
-        create_response = GATEWAY_CLIENT.create_gateway(
-            name=GATEWAY_NAME,
-            roleArn=gateway_iam_role_arn,
-            protocolType="MCP",
-            authorizerType="CUSTOM_JWT",
-            authorizerConfiguration=auth_config,
-            description="AgentCore Gateway for Customer Retention Agent's external tools",
-            tags={'project': 'customer-retention-agent', 'component': 'gateway'}
-        )
+        # Create directly; an existing gateway surfaces as ConflictException
+        try:
+            create_response = GATEWAY_CLIENT.create_gateway(
+                name=GATEWAY_NAME,
+                roleArn=gateway_iam_role_arn,
+                protocolType="MCP",
+                authorizerType="CUSTOM_JWT",
+                authorizerConfiguration=auth_config,
+                description="AgentCore Gateway for Customer Retention Agent's external tools",
+                tags={'project': 'customer-retention-agent', 'component': 'gateway'}
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConflictException':
+                raise
+            paginator = GATEWAY_CLIENT.get_paginator('list_gateways')
+            for page in paginator.paginate():
+                for gw in page.get('items', page.get('gateways', [])):
+                    if gw['name'] == GATEWAY_NAME:
+                        logger.info(f"✅ AgentCore Gateway '{GATEWAY_NAME}' already exists: {gw['gatewayId']}")
+                        # List summaries don't carry the URL - read it from the gateway itself
+                        gateway = GATEWAY_CLIENT.get_gateway(gatewayIdentifier=gw['gatewayId'])
+                        return gateway['gatewayId'], gateway['gatewayUrl']
+            raise
 
         gateway_id = create_response['gatewayId']
         gateway_url = create_response['gatewayUrl']
@@ -190,11 +233,14 @@ if __name__ == "__main__":
     try:
         logger.info("🚀 Starting AgentCore Gateway setup...")
         
-        # 1. Create or get Gateway IAM Role
-        gateway_iam_role_arn = create_gateway_iam_role()
+        # 1. Create or get Gateway IAM Role, reading the Cognito settings meanwhile
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            role_future = executor.submit(create_gateway_iam_role)
+            cognito_parameters = get_ssm_parameters(GATEWAY_AUTH_PARAMETER_PATHS)
+            gateway_iam_role_arn = role_future.result()
         
         # 2. Create or get AgentCore Gateway
-        gateway_id, gateway_url = create_agentcore_gateway(gateway_iam_role_arn)
+        gateway_id, gateway_url = create_agentcore_gateway(gateway_iam_role_arn, cognito_parameters)
         
         logger.info("🎉 AgentCore Gateway setup complete!")
         logger.info(f"Gateway ID: {gateway_id}")
@@ -7,9 +7,37 @@ Tests the invoke function directly with various scenarios
 import os
 import sys
 import json
+import orjson
+import asyncio
 import base64
+import time
+import hashlib
+import hmac
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
 from main import invoke
 
+# Access tokens are reused across runs until they are close to expiry
+TOKEN_CACHE_PATH = os.path.expanduser("~/.cache/cra-test/jwt.json")
+TOKEN_MIN_TTL_SECONDS = 60
+
+# Cognito App Client details
+USER_POOL_ID = os.environ.get("NEXT_PUBLIC_USER_POOL_ID", "YOUR_USER_POOL_ID")
+CLIENT_ID = os.environ.get("NEXT_PUBLIC_USER_POOL_WEB_CLIENT_ID", "YOUR_CLIENT_ID")
+CLIENT_SECRET = os.environ.get("NEXT_PUBLIC_USER_POOL_WEB_CLIENT_SECRET", "<secret>")
+REGION = os.environ.get("NEXT_PUBLIC_AWS_REGION", "us-east-1")
+_SECRET_HASH_KEY = CLIENT_SECRET.encode('utf-8')
+
+# Adaptive retries ride out InitiateAuth throttling instead of failing the run
+_BOTO_CFG = Config(retries={"max_attempts": 10, "mode": "adaptive"}, connect_timeout=3, read_timeout=10, tcp_keepalive=True)
+
+# Scenarios run concurrently; each one prints its log as a single block
+_PRINT_LOCK = threading.Lock()
+
 def decode_jwt_payload(token):
     """Decode JWT payload to see what's inside"""
     try:
@@ -19,49 +47,75 @@ def decode_jwt_payload(token):
             print(f"❌ Invalid JWT format: expected 3 parts, got {len(parts)}")
             return None
         
-        # Decode the payload (middle part)
-        payload = parts[1]
-        # Add padding if needed
-        payload += '=' * (4 - len(payload) % 4)
-        decoded = base64.b64decode(payload)
-        return json.loads(decoded)
+        # Decode the payload (middle part) - JWTs use unpadded base64url
+        payload = parts[1].encode()
+        decoded = base64.urlsafe_b64decode(payload + b"=" * (-len(payload) % 4))
+        return orjson.loads(decoded)
     except Exception as e:
         print(f"❌ Error decoding JWT: {e}")
         return None
 
+@functools.lru_cache(maxsize=4)
+def _cognito_client(region=REGION):
+    """Cognito client for region, built once and reused for repeated auth calls"""
+    return boto3.client('cognito-idp', region_name=region, config=_BOTO_CFG)
+
+@functools.lru_cache(maxsize=16)
+def _secret_hash(username):
+    """Cognito SECRET_HASH for username with the configured app client"""
+    dig = hmac.new(_SECRET_HASH_KEY, msg=(username + CLIENT_ID).encode('utf-8'), digestmod=hashlib.sha256).digest()
+    return base64.b64encode(dig).decode('utf-8')
+
+def _load_cached_token(username):
+    """Return a cached access token for username if it is still valid for a while"""
+    try:
+        with open(TOKEN_CACHE_PATH) as f:
+            token = json.load(f)[username]["token"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    payload = decode_jwt_payload(token)
+    if payload and payload.get("exp", 0) - time.time() > TOKEN_MIN_TTL_SECONDS:
+        return token
+    return None
+
+def _store_cached_token(username, token, exp):
+    """Persist an access token so later runs can skip InitiateAuth"""
+    try:
+        with open(TOKEN_CACHE_PATH) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+    cache[username] = {"token": token, "exp": exp}
+    try:
+        os.makedirs(os.path.dirname(TOKEN_CACHE_PATH), exist_ok=True)
+        fd = os.open(TOKEN_CACHE_PATH, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump(cache, f)
+    except OSError as e:
+        print(f"⚠️  Could not cache JWT token: {e}")
+
 def get_test_jwt_token():
     """Get a test JWT token for local testing"""
     try:
-        import boto3
-        from botocore.exceptions import ClientError
-        import hashlib
-        import hmac
-
         # Test credentials
         username = "test-user"
         password = "<test-pw>"
         
-        # Cognito App Client details
-        user_pool_id = os.environ.get("NEXT_PUBLIC_USER_POOL_ID", "YOUR_USER_POOL_ID")
-        client_id = os.environ.get("NEXT_PUBLIC_USER_POOL_WEB_CLIENT_ID", "YOUR_CLIENT_ID")
-        client_secret = os.environ.get("NEXT_PUBLIC_USER_POOL_WEB_CLIENT_SECRET", "<secret>")
-        region = os.environ.get("NEXT_PUBLIC_AWS_REGION", "us-east-1")
-
-        cognito_client = boto3.client('cognito-idp', region_name=region)
-
-        # Calculate SECRET_HASH
-        message = username + client_id
-        dig = hmac.new(client_secret.encode('utf-8'), msg=message.encode('utf-8'), digestmod=hashlib.sha256).digest()
-        secret_hash = base64.b64encode(dig).decode('utf-8')
+        cached_token = _load_cached_token(username)
+        if cached_token:
+            print(f"✅ Using cached access token: {cached_token[:50]}...")
+            return cached_token
+        
+        cognito_client = _cognito_client()
 
         response = cognito_client.initiate_auth(
             AuthFlow='USER_PASSWORD_AUTH',
             AuthParameters={
                 'USERNAME': username,
                 'PASSWORD': password,
-                'SECRET_HASH': secret_hash,
+                'SECRET_HASH': _secret_hash(username),
             },
-            ClientId=client_id
+            ClientId=CLIENT_ID
         )
         
         auth_result = response['AuthenticationResult']
@@ -74,6 +128,8 @@ def get_test_jwt_token():
         token_payload = decode_jwt_payload(access_token)
         if token_payload:
             print(f"🔍 JWT Payload: {json.dumps(token_payload, indent=2)}")
+            if "exp" in token_payload:
+                _store_cached_token(username, access_token, token_payload["exp"])
         else:
             print("❌ Failed to decode JWT payload")
         
@@ -88,13 +144,11 @@ def get_test_jwt_token():
 
 def test_agent_scenario(scenario_name, prompt, customer_id=None, user_id=None):
     """Test a specific scenario with the agent"""
-    print(f"\n🧪 Testing Scenario: {scenario_name}")
-    print("-" * 50)
-    print(f"Prompt: {prompt}")
+    lines = [f"\n🧪 Testing Scenario: {scenario_name}", "-" * 50, f"Prompt: {prompt}"]
     if customer_id:
-        print(f"Customer ID: {customer_id}")
+        lines.append(f"Customer ID: {customer_id}")
     if user_id:
-        print(f"User ID: {user_id}")
+        lines.append(f"User ID: {user_id}")
     
     try:
         # Create payload
@@ -113,14 +167,20 @@ def test_agent_scenario(scenario_name, prompt, customer_id=None, user_id=None):
             }
         
         # Call the invoke function
-        response = invoke(payload, user_id=user_id, context=context)
+        response = asyncio.run(invoke(payload, user_id=user_id, context=context))
         
-        print(f"✅ Response: {response}")
+        lines.append(f"✅ Response: {response}")
         return True
         
     except Exception as e:
-        print(f"❌ Error: {e}")
+        lines.append(f"❌ Error: {e}")
         return False
+    finally:
+        # One write per scenario keeps concurrent output unbroken
+        lines.append("")
+        with _PRINT_LOCK:
+            sys.stdout.write("\n".join(lines))
+            sys.stdout.flush()
 
 def main():
     print("🧪 Local Agent Testing Suite")
@@ -162,15 +222,30 @@ def main():
     success_count = 0
     total_tests = len(test_scenarios)
     
+    # Scenarios for the same customer share conversation memory and must run in
+    # order; different customers are independent and run concurrently.
+    scenarios_by_customer = {}
     for scenario in test_scenarios:
-        success = test_agent_scenario(
-            scenario["name"],
-            scenario["prompt"],
-            scenario.get("customer_id"),
-            jwt_token
+        scenarios_by_customer.setdefault(scenario.get("customer_id"), []).append(scenario)
+    
+    def run_customer_scenarios(scenarios):
+        return sum(
+            1 for scenario in scenarios
+            if test_agent_scenario(
+                scenario["name"],
+                scenario["prompt"],
+                scenario.get("customer_id"),
+                jwt_token
+            )
         )
-        if success:
-            success_count += 1
+    
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        futures = [
+            executor.submit(run_customer_scenarios, scenarios)
+            for scenarios in scenarios_by_customer.values()
+        ]
+        for future in as_completed(futures):
+            success_count += future.result()
     
     # Summary
     print("\n" + "=" * 60)
@@ -1,17 +1,89 @@
-import json
+import csv
+import codecs
+import orjson
 import logging
+import os
+import re
+import time
 import boto3
+from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Any
 
 # Configure logging
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+logger = logging.getLogger(__name__)
+logger.setLevel(os.environ.get('LOG_LEVEL', 'INFO').upper())
 
 # Initialize AWS clients
-athena_client = boto3.client('athena')
-s3_client = boto3.client('s3')
+# Clients live across warm invocations; keep-alive and adaptive retries ride out bursts and throttling
+_BOTO_CONFIG = Config(max_pool_connections=50, retries={'max_attempts': 10, 'mode': 'adaptive'}, tcp_keepalive=True)
+athena_client = boto3.client('athena', config=_BOTO_CONFIG)
+s3_client = boto3.client('s3', config=_BOTO_CONFIG)
 
-def execute_athena_query(query: str, database: str, output_location: str) -> Dict[str, Any]:
+# Status polling backoff: short first wait so sub-second queries return quickly
+POLL_INITIAL_DELAY = 0.15
+POLL_BACKOFF = 1.25
+POLL_MAX_DELAY = 1.0
+
+# Request limits, checked before any parsing or querying
+MAX_BODY_BYTES = 4096
+CUSTOMER_ID_PATTERN = re.compile(r'[A-Za-z0-9-]{1,64}')
+MAX_BATCH_CUSTOMERS = 50
+
+# Upper bound on concurrent Athena queries for per-customer fan-out
+ATHENA_MAX_CONCURRENT = int(os.environ.get('ATHENA_MAX_CONCURRENT', '10'))
+
+# Columns read by analyze_customer_churn; anything else in the view would only add scanned bytes
+CHURN_QUERY_COLUMNS = (
+    'customerid',
+    'tenure',
+    'phoneservice',
+    'internetservice',
+    'onlinesecurity',
+    'techsupport',
+    'streamingtv',
+    'streamingmovies',
+    'paperlessbilling',
+    'paymentmethod',
+    'monthlycharges',
+    'totalcharges',
+    'churn',
+    'contract',
+    'churn_risk_score',
+    'cancel_intent',
+)
+
+# Risk bucketing is computed by Athena alongside the row
+RISK_LEVEL_EXPRESSION = (
+    "CASE WHEN churn_risk_score >= 0.7 THEN 'HIGH' "
+    "WHEN churn_risk_score >= 0.4 THEN 'MEDIUM' "
+    "ELSE 'LOW' END AS risk_level"
+)
+
+# Churn risk rules: (condition(customer_data, tenure, monthly_charges), risk factor, recommendation or None)
+RISK_RULES = (
+    (lambda d, tenure, monthly: d.get('contract') == 'Month-to-month',
+     'Month-to-month contract', 'Offer annual contract discount'),
+    (lambda d, tenure, monthly: tenure <= 3,
+     'Low tenure (≤3 months)', 'Provide onboarding support and welcome offers'),
+    (lambda d, tenure, monthly: d.get('onlinesecurity') == 'No',
+     'No online security', 'Promote online security add-on'),
+    (lambda d, tenure, monthly: d.get('techsupport') == 'No',
+     'No tech support', None),
+    (lambda d, tenure, monthly: monthly > 80,
+     'High monthly charges', 'Review service bundle and offer discounts'),
+)
+
+def is_valid_customer_id(value) -> bool:
+    """Customer IDs are short alphanumeric/hyphen strings such as 3916-NRPAP."""
+    return isinstance(value, str) and CUSTOMER_ID_PATTERN.fullmatch(value.strip()) is not None
+
+def sql_string_literal(value: str) -> str:
+    """Quote a value for use as a string ExecutionParameter (Athena substitutes it verbatim)."""
+    return "'" + value.replace("'", "''") + "'"
+
+def execute_athena_query(query: str, database: str, output_location: str, result_reuse_minutes: int = 60,
+                         execution_parameters: List[str] = None) -> Dict[str, Any]:
     """
     Execute an Athena query and return results.
     
@@ -19,22 +91,33 @@ def execute_athena_query(query: str, database: str, output_location: str) -> Dic
         query (str): SQL query to execute
         database (str): Athena database name
         output_location (str): S3 location for query results
+        result_reuse_minutes (int): Max age of cached results Athena may reuse (0 disables reuse)
+        execution_parameters (List[str]): Values for the query's ? placeholders, in order
         
     Returns:
         Dict containing query results and metadata
     """
     try:
         # Start query execution
-        response = athena_client.start_query_execution(
-            QueryString=query,
-            QueryExecutionContext={'Database': database},
-            ResultConfiguration={'OutputLocation': output_location}
-        )
+        request = {
+            'QueryString': query,
+            'QueryExecutionContext': {'Database': database},
+            'ResultConfiguration': {'OutputLocation': output_location}
+        }
+        if execution_parameters:
+            request['ExecutionParameters'] = execution_parameters
+        if result_reuse_minutes > 0:
+            # Repeat lookups of the same customer are served from the previous result without a scan
+            request['ResultReuseConfiguration'] = {
+                'ResultReuseByAgeConfiguration': {'Enabled': True, 'MaxAgeInMinutes': result_reuse_minutes}
+            }
+        response = athena_client.start_query_execution(**request)
         
         query_execution_id = response['QueryExecutionId']
-        logger.info(f"Started Athena query execution: {query_execution_id}")
+        logger.debug(f"Started Athena query execution: {query_execution_id}")
         
-        # Wait for query to complete
+        # Wait for query to complete (Athena has no boto3 waiter, so back off by hand)
+        delay = POLL_INITIAL_DELAY
         while True:
             response = athena_client.get_query_execution(QueryExecutionId=query_execution_id)
             status = response['QueryExecution']['Status']['State']
@@ -45,35 +128,32 @@ def execute_athena_query(query: str, database: str, output_location: str) -> Dic
                 error_reason = response['QueryExecution']['Status'].get('StateChangeReason', 'Unknown error')
                 raise Exception(f"Query failed: {error_reason}")
             
-            # Wait 2 seconds before checking again
-            import time
-            time.sleep(2)
-        
-        # Get query results
-        results_response = athena_client.get_query_results(QueryExecutionId=query_execution_id)
-        
-        # Parse results
-        rows = results_response['ResultSet']['Rows']
-        if len(rows) < 2:  # Less than header + 1 data row
-            return {'results': [], 'row_count': 0}
-        
-        # Extract column names from first row
-        columns = [col['VarCharValue'] for col in rows[0]['Data']]
-        
-        # Extract data rows
-        results = []
-        for row in rows[1:]:  # Skip header row
-            row_data = {}
-            for i, col in enumerate(row['Data']):
-                value = col.get('VarCharValue', '')
-                row_data[columns[i]] = value
-            results.append(row_data)
+            time.sleep(delay)
+            delay = min(delay * POLL_BACKOFF, POLL_MAX_DELAY)
+        
+        # Read the result CSV straight from S3: one GET instead of paginated get_query_results calls
+        result_location = response['QueryExecution']['ResultConfiguration']['OutputLocation']
+        bucket, _, key = result_location[len('s3://'):].partition('/')
+        body = s3_client.get_object(Bucket=bucket, Key=key)['Body']
         
+        try:
+            reader = csv.DictReader(codecs.getreader('utf-8')(body))
+            results = list(reader)
+            columns = reader.fieldnames or []
+        finally:
+            body.close()
+        
+        statistics = response['QueryExecution'].get('Statistics', {})
         return {
             'results': results,
             'row_count': len(results),
             'columns': columns,
-            'query_execution_id': query_execution_id
+            'query_execution_id': query_execution_id,
+            'statistics': {
+                'athena_ms': statistics.get('TotalExecutionTimeInMillis', 0),
+                'bytes_scanned': statistics.get('DataScannedInBytes', 0),
+                'cache_hit': statistics.get('ResultReuseInformation', {}).get('ReusedPreviousResult', False)
+            }
         }
         
     except Exception as e:
@@ -90,69 +170,115 @@ def get_customer_churn_data(customer_id: str) -> Dict[str, Any]:
     Returns:
         Dict containing customer churn data and risk analysis
     """
+    return get_customers_churn_data([customer_id])[customer_id]
+
+def get_customers_churn_data(customer_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Get churn data for several customers with a single Athena query.
+    
+    Args:
+        customer_ids (List[str]): Customer IDs to query
+        
+    Returns:
+        Dict mapping each customer ID to its churn data and risk analysis
+    """
     try:
         # Athena configuration
         database = 'telco_processed_db'
         output_location = 's3://aws-athena-query-results-us-east-1-412602263780/'
         
+        customer_ids = list(dict.fromkeys(customer_ids))  # De-duplicate, keep order
+        
         # Query to get customer data from the augmented view
         query = f"""
-        SELECT 
-            customerid,
-            gender,
-            seniorcitizen,
-            partner,
-            dependents,
-            tenure,
-            phoneservice,
-            multiplelines,
-            internetservice,
-            onlinesecurity,
-            onlinebackup,
-            deviceprotection,
-            techsupport,
-            streamingtv,
-            streamingmovies,
-            paperlessbilling,
-            paymentmethod,
-            monthlycharges,
-            totalcharges,
-            churn,
-            contract,
-            status,
-            churn_risk_score,
-            cancel_intent
+        SELECT {', '.join(CHURN_QUERY_COLUMNS)}, {RISK_LEVEL_EXPRESSION}
         FROM telco_augmented_vw 
-        WHERE customerid = '{customer_id}'
+        WHERE customerid IN ({', '.join('?' * len(customer_ids))})
         """
         
-        logger.info(f"Executing churn data query for customer: {customer_id}")
+        logger.debug(f"Executing churn data query for customers: {customer_ids}")
         
         # Execute query
-        query_result = execute_athena_query(query, database, output_location)
+        query_result = execute_athena_query(
+            query, database, output_location,
+            execution_parameters=[sql_string_literal(customer_id) for customer_id in customer_ids]
+        )
+        
+        # Group rows by customer (one row per customer is expected; keep the first)
+        rows_by_customer = {}
+        for row in query_result['results']:
+            rows_by_customer.setdefault(row.get('customerid'), row)
         
-        if query_result['row_count'] == 0:
+        churn_data = {
+            customer_id: analyze_customer_churn(customer_id, rows_by_customer.get(customer_id))
+            for customer_id in customer_ids
+        }
+        
+        # One structured line per query for Logs Insights
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(orjson.dumps({
+                'event': 'churn_data_query',
+                'customer_ids': customer_ids,
+                'row_count': query_result['row_count'],
+                'churn_risk_scores': {
+                    customer_id: data['churn_analysis']['churn_risk_score']
+                    for customer_id, data in churn_data.items() if data['found']
+                },
+                **query_result['statistics']
+            }).decode())
+        
+        return churn_data
+        
+    except Exception as e:
+        logger.error(f"Error getting customer churn data: {str(e)}")
+        raise
+
+def get_customers_churn_data_parallel(customer_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Get churn data for several customers with one Athena query per customer, run concurrently.
+    
+    For lookups that can't be folded into a single IN-list query; all queries share athena_client.
+    
+    Args:
+        customer_ids (List[str]): Customer IDs to query
+        
+    Returns:
+        Dict mapping each customer ID to its churn data and risk analysis
+    """
+    customer_ids = list(dict.fromkeys(customer_ids))
+    max_workers = max(1, min(ATHENA_MAX_CONCURRENT, len(customer_ids)))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return dict(zip(customer_ids, executor.map(get_customer_churn_data, customer_ids)))
+
+def analyze_customer_churn(customer_id: str, customer_data: Dict[str, str]) -> Dict[str, Any]:
+    """
+    Build the churn risk analysis for one customer's row.
+    
+    Args:
+        customer_id (str): Customer ID that was queried
+        customer_data (Dict[str, str]): The customer's row, or None if not found
+        
+    Returns:
+        Dict containing customer churn data and risk analysis
+    """
+    try:
+        if customer_data is None:
             return {
                 'customer_id': customer_id,
                 'found': False,
                 'message': 'Customer not found in database'
             }
         
-        # Get customer data (should be only one row)
-        customer_data = query_result['results'][0]
+        # Parse numeric columns once (empty CSV fields are nulls)
+        tenure = int(customer_data.get('tenure') or 0)
+        monthly_charges = float(customer_data.get('monthlycharges') or 0)
+        total_charges = float(customer_data.get('totalcharges') or 0)
         
         # Analyze churn risk
-        churn_risk_score = float(customer_data.get('churn_risk_score', 0))
+        churn_risk_score = float(customer_data.get('churn_risk_score') or 0)
         cancel_intent = customer_data.get('cancel_intent', 'false').lower() == 'true'
         churn_status = customer_data.get('churn', 'No')
-        
-        # Determine risk level
-        if churn_risk_score >= 0.7:
-            risk_level = 'HIGH'
-        elif churn_risk_score >= 0.4:
-            risk_level = 'MEDIUM'
-        else:
-            risk_level = 'LOW'
+        risk_level = customer_data.get('risk_level') or 'LOW'
         
         # Format response
         response = {
@@ -165,10 +291,10 @@ def get_customer_churn_data(customer_id: str) -> Dict[str, Any]:
                 'cancel_intent': cancel_intent
             },
             'customer_profile': {
-                'tenure_months': int(customer_data.get('tenure', 0)),
+                'tenure_months': tenure,
                 'contract_type': customer_data.get('contract', ''),
-                'monthly_charges': float(customer_data.get('monthlycharges', 0)),
-                'total_charges': float(customer_data.get('totalcharges', 0)),
+                'monthly_charges': monthly_charges,
+                'total_charges': total_charges,
                 'payment_method': customer_data.get('paymentmethod', ''),
                 'paperless_billing': customer_data.get('paperlessbilling', ''),
                 'services': {
@@ -186,40 +312,55 @@ def get_customer_churn_data(customer_id: str) -> Dict[str, Any]:
             }
         }
         
-        # Identify key risk factors
+        # Identify key risk factors and their recommendations in one pass
         risk_factors = []
-        if customer_data.get('contract') == 'Month-to-month':
-            risk_factors.append('Month-to-month contract')
-        if int(customer_data.get('tenure', 0)) <= 3:
-            risk_factors.append('Low tenure (≤3 months)')
-        if customer_data.get('onlinesecurity') == 'No':
-            risk_factors.append('No online security')
-        if customer_data.get('techsupport') == 'No':
-            risk_factors.append('No tech support')
-        if float(customer_data.get('monthlycharges', 0)) > 80:
-            risk_factors.append('High monthly charges')
-        
-        response['retention_insights']['key_risk_factors'] = risk_factors
-        
-        # Generate recommendations based on risk factors
         recommendations = []
-        if 'Month-to-month contract' in risk_factors:
-            recommendations.append('Offer annual contract discount')
-        if 'Low tenure' in risk_factors:
-            recommendations.append('Provide onboarding support and welcome offers')
-        if 'No online security' in risk_factors:
-            recommendations.append('Promote online security add-on')
-        if 'High monthly charges' in risk_factors:
-            recommendations.append('Review service bundle and offer discounts')
+        for condition, factor, recommendation in RISK_RULES:
+            if condition(customer_data, tenure, monthly_charges):
+                risk_factors.append(factor)
+                if recommendation:
+                    recommendations.append(recommendation)
         
+        response['retention_insights']['key_risk_factors'] = risk_factors
         response['retention_insights']['recommendations'] = recommendations
         
         return response
         
     except Exception as e:
-        logger.error(f"Error getting customer churn data: {str(e)}")
+        logger.error(f"Error analyzing churn data for customer {customer_id}: {str(e)}")
         raise
 
+def extract_payload(event) -> Dict[str, Any]:
+    """
+    Return the request data: the parsed body for API Gateway events, the event itself otherwise.
+    
+    Args:
+        event: The Lambda event
+        
+    Returns:
+        Dict of request parameters
+    """
+    if 'body' not in event:
+        return event
+    body = event['body']
+    return orjson.loads(body) if isinstance(body, (str, bytes)) else (body or {})
+
+def build_response(event, status_code: int, payload: Dict[str, Any]):
+    """
+    Wrap a payload for API Gateway; direct (agent/Gateway) invocations get the dict itself.
+    
+    Args:
+        event: The Lambda event being answered
+        status_code (int): HTTP status code for API Gateway callers
+        payload (Dict[str, Any]): Response data
+        
+    Returns:
+        API Gateway proxy response, or payload unchanged for direct invocations
+    """
+    if isinstance(event, dict) and 'body' in event:
+        return {'statusCode': status_code, 'body': orjson.dumps(payload).decode()}
+    return payload
+
 def lambda_handler(event, context):
     """
     Churn Data Query Lambda function for Customer Retention Agent.
@@ -228,7 +369,7 @@ def lambda_handler(event, context):
     churn risk analysis and retention insights for the retention agent.
     
     Args:
-        event: Lambda event containing customer ID and query parameters
+        event: Lambda event containing customer ID (or a customer_ids list) and query parameters
         context: Lambda context object
         
     Returns:
@@ -236,49 +377,78 @@ def lambda_handler(event, context):
     """
     
     try:
-        # Handle API Gateway event
-        if 'body' in event:
-            # API Gateway event - parse JSON body
-            body = json.loads(event['body']) if isinstance(event['body'], str) else event['body']
-            customer_id = body.get('customer_id', '')
-        else:
-            # Direct invocation event
-            customer_id = event.get('customer_id', '')
+        # Reject oversized bodies before paying to parse them
+        raw_body = event.get('body') if isinstance(event, dict) else None
+        if isinstance(raw_body, (str, bytes)) and len(raw_body) > MAX_BODY_BYTES:
+            return build_response(event, 413, {
+                'error': f'Request body exceeds {MAX_BODY_BYTES} bytes',
+                'source': 'churn_data_query'
+            })
         
-        logger.info(f"Processing churn data query for customer: {customer_id}")
+        # API Gateway body or direct invocation event
+        body = extract_payload(event)
+        customer_id = body.get('customer_id', '')
+        customer_ids = body.get('customer_ids')
         
-        # Validate input
-        if not customer_id or not customer_id.strip():
-            return {
-                'statusCode': 400,
-                'body': json.dumps({
-                    'error': 'Customer ID is required',
-                    'customer_id': customer_id
+        # Batch lookup: one Athena query for all requested customers
+        if customer_ids:
+            if not isinstance(customer_ids, list):
+                return build_response(event, 400, {
+                    'error': 'customer_ids must be a list',
+                    'customer_ids': customer_ids
                 })
-            }
+            if len(customer_ids) > MAX_BATCH_CUSTOMERS:
+                return build_response(event, 400, {
+                    'error': f'At most {MAX_BATCH_CUSTOMERS} customer IDs per request',
+                    'count': len(customer_ids)
+                })
+            customer_ids = [str(cid).strip() for cid in customer_ids if cid and str(cid).strip()]
+            if not customer_ids:
+                return build_response(event, 400, {
+                    'error': 'At least one customer ID is required',
+                    'customer_ids': body.get('customer_ids')
+                })
+            if not all(map(is_valid_customer_id, customer_ids)):
+                return build_response(event, 400, {
+                    'error': 'Invalid customer ID',
+                    'customer_ids': customer_ids
+                })
+            
+            logger.debug(f"Processing churn data query for {len(customer_ids)} customers")
+            return build_response(event, 200, {
+                'customer_ids': customer_ids,
+                'churn_data': (get_customers_churn_data_parallel(customer_ids) if body.get('parallel')
+                               else get_customers_churn_data(customer_ids)),
+                'source': 'churn_data_query'
+            })
         
-        # Get customer churn data
-        churn_data = get_customer_churn_data(customer_id.strip())
+        logger.debug(f"Processing churn data query for customer: {customer_id}")
         
-        response = {
-            'statusCode': 200,
-            'body': json.dumps({
-                'customer_id': customer_id,
-                'churn_data': churn_data,
-                'source': 'churn_data_query'
+        # Validate input
+        if not customer_id or not str(customer_id).strip():
+            return build_response(event, 400, {
+                'error': 'Customer ID is required',
+                'customer_id': customer_id
+            })
+        if not is_valid_customer_id(customer_id):
+            return build_response(event, 400, {
+                'error': 'Invalid customer ID',
+                'customer_id': customer_id
             })
-        }
         
-        logger.info(f"Successfully processed churn data query for customer: {customer_id}")
-        return response
+        # Get customer churn data
+        churn_data = get_customer_churn_data(customer_id.strip())
+        
+        return build_response(event, 200, {
+            'customer_id': customer_id,
+            'churn_data': churn_data,
+            'source': 'churn_data_query'
+        })
         
     except Exception as e:
         logger.error(f"Error processing churn data query: {str(e)}")
-        return {
-            'statusCode': 500,
-            'body': json.dumps({
-                'error': 'Internal server error',
-                'message': str(e),
-                'source': 'churn_data_query'
-            })
-        }
+        return build_response(event, 500, {
+            'error': 'Internal server error',
+            'message': str(e),
+            'source': 'churn_data_query'
+        })
@@ -1,11 +1,62 @@
 import json
+import orjson
 import logging
+import os
+import re
 import random
+import secrets
 from typing import Dict, List, Any
 
 # Configure logging
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+logger = logging.getLogger(__name__)
+logger.setLevel(os.environ.get('LOG_LEVEL', 'INFO').upper())
+
+# Request limits, checked before any parsing (bodies carry the churn_data_query result)
+MAX_BODY_BYTES = 16384
+CUSTOMER_ID_PATTERN = re.compile(r'[A-Za-z0-9-]{1,64}')
+
+# Free service add-ons, built once; each offer is copied before it is returned
+_SERVICE_OFFER_TEMPLATES = (
+    {
+        "offer_type": "service_upgrade",
+        "code": "FREEONLINE",
+        "title": "Free Online Security",
+        "description": "3 months free online security add-on",
+        "service": "online_security",
+        "value": 15.0,
+        "validity_days": 90,
+        "priority": "medium"
+    },
+    {
+        "offer_type": "service_upgrade",
+        "code": "FREETECH_S",
+        "title": "Free Premium Tech Support",
+        "description": "6 months free premium tech support",
+        "service": "tech_support",
+        "value": 20.0,
+        "validity_days": 180,
+        "priority": "medium"
+    },
+    {
+        "offer_type": "service_upgrade",
+        "code": "FREESTREAM",
+        "title": "Free Streaming TV",
+        "description": "2 months free streaming TV service",
+        "service": "streaming_tv",
+        "value": 25.0,
+        "validity_days": 60,
+        "priority": "medium"
+    },
+)
+
+# Static parts of the discount offers; the percentage is drawn per offer
+_HIGH_VALUE_DISCOUNT = {"offer_type": "discount_coupon", "validity_days": 90, "priority": "high"}
+_STANDARD_DISCOUNT = {"offer_type": "discount_coupon", "validity_days": 60, "priority": "medium"}
+_ANNUAL_CONTRACT_DISCOUNT = {"offer_type": "contract_discount", "validity_days": 30, "priority": "high"}
+
+def is_valid_customer_id(value) -> bool:
+    """Customer IDs are short alphanumeric/hyphen strings such as 3916-NRPAP."""
+    return isinstance(value, str) and CUSTOMER_ID_PATTERN.fullmatch(value.strip()) is not None
 
 def generate_discount_coupons(customer_profile: Dict[str, Any]) -> List[Dict[str, Any]]:
     """
@@ -24,36 +75,33 @@ def generate_discount_coupons(customer_profile: Dict[str, Any]) -> List[Dict[str
     
     # High-value discount for immediate retention
     if monthly_charges > 70:
+        pct = random.randint(20, 30)
         offers.append({
-            "offer_type": "discount_coupon",
-            "code": f"SAVE{random.randint(20, 30)}",
-            "title": f"{random.randint(20, 30)}% Off Next 3 Months",
-            "description": f"Save {random.randint(20, 30)}% on your monthly bill for the next 3 months",
-            "discount_percentage": random.randint(20, 30),
-            "validity_days": 90,
-            "priority": "high"
+            **_HIGH_VALUE_DISCOUNT,
+            "code": f"SAVE{pct}-{secrets.token_hex(3).upper()}",
+            "title": f"{pct}% Off Next 3 Months",
+            "description": f"Save {pct}% on your monthly bill for the next 3 months",
+            "discount_percentage": pct
         })
     else:
+        pct = random.randint(15, 25)
         offers.append({
-            "offer_type": "discount_coupon",
-            "code": f"SAVE{random.randint(15, 25)}",
-            "title": f"{random.randint(15, 25)}% Off Next 2 Months",
-            "description": f"Save {random.randint(15, 25)}% on your monthly bill for the next 2 months",
-            "discount_percentage": random.randint(15, 25),
-            "validity_days": 60,
-            "priority": "medium"
+            **_STANDARD_DISCOUNT,
+            "code": f"SAVE{pct}-{secrets.token_hex(3).upper()}",
+            "title": f"{pct}% Off Next 2 Months",
+            "description": f"Save {pct}% on your monthly bill for the next 2 months",
+            "discount_percentage": pct
         })
     
     # Annual contract discount
     if customer_profile.get('contract_type') == 'Month-to-month':
+        pct = random.randint(40, 50)
         offers.append({
-            "offer_type": "contract_discount",
-            "code": f"ANNUAL{random.randint(40, 50)}",
-            "title": f"{random.randint(40, 50)}% Off Annual Contract",
-            "description": f"Switch to annual contract and save {random.randint(40, 50)}%",
-            "discount_percentage": random.randint(40, 50),
-            "validity_days": 30,
-            "priority": "high"
+            **_ANNUAL_CONTRACT_DISCOUNT,
+            "code": f"ANNUAL{pct}-{secrets.token_hex(3).upper()}",
+            "title": f"{pct}% Off Annual Contract",
+            "description": f"Switch to annual contract and save {pct}%",
+            "discount_percentage": pct
         })
     
     return offers
@@ -68,49 +116,8 @@ def generate_service_offers(customer_profile: Dict[str, Any]) -> List[Dict[str,
     Returns:
         List of service offers
     """
-    offers = []
-    
-    # Free service add-ons
-    service_offers = [
-        {
-            "service": "online_security",
-            "title": "Free Online Security",
-            "description": "3 months free online security add-on",
-            "value": 15.0,
-            "validity_days": 90
-        },
-        {
-            "service": "tech_support",
-            "title": "Free Premium Tech Support",
-            "description": "6 months free premium tech support",
-            "value": 20.0,
-            "validity_days": 180
-        },
-        {
-            "service": "streaming_tv",
-            "title": "Free Streaming TV",
-            "description": "2 months free streaming TV service",
-            "value": 25.0,
-            "validity_days": 60
-        }
-    ]
-    
-    # Select 1-2 random service offers
-    selected_offers = random.sample(service_offers, min(2, len(service_offers)))
-    
-    for offer in selected_offers:
-        offers.append({
-            "offer_type": "service_upgrade",
-            "code": f"FREE{offer['service'].upper()[:6]}",
-            "title": offer['title'],
-            "description": offer['description'],
-            "service": offer['service'],
-            "value": offer['value'],
-            "validity_days": offer['validity_days'],
-            "priority": "medium"
-        })
-    
-    return offers
+    # Select 2 random service offers; copies, since urgency is added to them later
+    return [dict(offer) for offer in random.sample(_SERVICE_OFFER_TEMPLATES, 2)]
 
 def generate_retention_offers(customer_id: str, churn_data: Dict[str, Any]) -> Dict[str, Any]:
     """
@@ -130,7 +137,7 @@ def generate_retention_offers(customer_id: str, churn_data: Dict[str, Any]) -> D
         risk_level = churn_analysis.get('risk_level', 'LOW')
         churn_risk_score = churn_analysis.get('churn_risk_score', 0)
         
-        logger.info(f"Generating offers for customer {customer_id} with risk level: {risk_level}")
+        logger.debug(f"Generating offers for customer {customer_id} with risk level: {risk_level}")
         
         offers = []
         recommended_action = ""
@@ -175,13 +182,44 @@ def generate_retention_offers(customer_id: str, churn_data: Dict[str, Any]) -> D
             'offer_strategy': f"Risk-based strategy for {risk_level} risk customer"
         }
         
-        logger.info(f"Generated {len(offers)} offers for customer {customer_id}")
+        logger.debug(f"Generated {len(offers)} offers for customer {customer_id}")
         return response
         
     except Exception as e:
         logger.error(f"Error generating retention offers: {str(e)}")
         raise
 
+def extract_payload(event) -> Dict[str, Any]:
+    """
+    Return the request data: the parsed body for API Gateway events, the event itself otherwise.
+    
+    Args:
+        event: The Lambda event
+        
+    Returns:
+        Dict of request parameters
+    """
+    if 'body' not in event:
+        return event
+    body = event['body']
+    return orjson.loads(body) if isinstance(body, (str, bytes)) else (body or {})
+
+def build_response(event, status_code: int, payload: Dict[str, Any]):
+    """
+    Wrap a payload for API Gateway; direct (agent/Gateway) invocations get the dict itself.
+    
+    Args:
+        event: The Lambda event being answered
+        status_code (int): HTTP status code for API Gateway callers
+        payload (Dict[str, Any]): Response data
+        
+    Returns:
+        API Gateway proxy response, or payload unchanged for direct invocations
+    """
+    if isinstance(event, dict) and 'body' in event:
+        return {'statusCode': status_code, 'body': orjson.dumps(payload).decode()}
+    return payload
+
 def lambda_handler(event, context):
     """
     Retention Offer Lambda function for Customer Retention Agent.
@@ -198,75 +236,65 @@ def lambda_handler(event, context):
     """
     
     try:
-        # Log the entire incoming event for debugging
-        logger.info(f"=== RETENTION OFFER LAMBDA DEBUG ===")
-        logger.info(f"Full event received: {json.dumps(event, indent=2)}")
-        logger.info(f"Event type: {type(event)}")
-        logger.info(f"Event keys: {list(event.keys()) if isinstance(event, dict) else 'Not a dict'}")
+        # Log the entire incoming event for debugging (set LOG_LEVEL=DEBUG)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Full event received: {json.dumps(event, indent=2)}")
         
-        # Handle API Gateway event
-        if 'body' in event:
-            # API Gateway event - parse JSON body
-            logger.info("Processing API Gateway event with body")
-            body = json.loads(event['body']) if isinstance(event['body'], str) else event['body']
-            logger.info(f"Parsed body: {json.dumps(body, indent=2)}")
-            customer_id = body.get('customer_id', '')
-            churn_data = body.get('churn_data', {})
-        else:
-            # Direct invocation event
-            logger.info("Processing direct invocation event")
-            customer_id = event.get('customer_id', '')
-            churn_data = event.get('churn_data', {})
-            logger.info(f"Direct event customer_id: {customer_id}")
-            logger.info(f"Direct event churn_data: {json.dumps(churn_data, indent=2)}")
+        # Reject oversized bodies before paying to parse them
+        raw_body = event.get('body') if isinstance(event, dict) else None
+        if isinstance(raw_body, (str, bytes)) and len(raw_body) > MAX_BODY_BYTES:
+            return build_response(event, 413, {
+                'error': f'Request body exceeds {MAX_BODY_BYTES} bytes',
+                'source': 'retention_offer'
+            })
         
-        logger.info(f"Extracted customer_id: '{customer_id}'")
-        logger.info(f"Extracted churn_data: {json.dumps(churn_data, indent=2)}")
-        logger.info(f"Processing retention offer request for customer: {customer_id}")
+        # API Gateway body or direct invocation event
+        body = extract_payload(event)
+        customer_id = body.get('customer_id', '')
+        churn_data = body.get('churn_data', {})
         
         # Validate input
-        if not customer_id or not customer_id.strip():
-            return {
-                'statusCode': 400,
-                'body': json.dumps({
-                    'error': 'Customer ID is required',
-                    'customer_id': customer_id
-                })
-            }
+        if not customer_id or not str(customer_id).strip():
+            return build_response(event, 400, {
+                'error': 'Customer ID is required',
+                'customer_id': customer_id
+            })
+        if not is_valid_customer_id(customer_id):
+            return build_response(event, 400, {
+                'error': 'Invalid customer ID',
+                'customer_id': customer_id
+            })
         
         if not churn_data:
-            return {
-                'statusCode': 400,
-                'body': json.dumps({
-                    'error': 'Churn data is required',
-                    'customer_id': customer_id
-                })
-            }
-        
-        logger.info(f"Using provided churn data: {json.dumps(churn_data, indent=2)}")
+            return build_response(event, 400, {
+                'error': 'Churn data is required',
+                'customer_id': customer_id
+            })
         
         # Generate retention offers using the provided churn data
         retention_offers = generate_retention_offers(customer_id.strip(), churn_data)
         
-        response = {
-            'statusCode': 200,
-            'body': json.dumps({
-                'customer_id': customer_id,
-                'retention_offers': retention_offers,
-                'source': 'retention_offer'
-            })
-        }
+        response = build_response(event, 200, {
+            'customer_id': customer_id,
+            'retention_offers': retention_offers,
+            'source': 'retention_offer'
+        })
         
-        logger.info(f"Successfully generated retention offers for customer: {customer_id}")
+        # One structured line per invocation for Logs Insights
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(orjson.dumps({
+                'event': 'retention_offer',
+                'customer_id': customer_id,
+                'risk_level': retention_offers['risk_level'],
+                'churn_risk_score': retention_offers['churn_risk_score'],
+                'offer_count': retention_offers['total_offers']
+            }).decode())
         return response
         
     except Exception as e:
         logger.error(f"Error processing retention offer request: {str(e)}")
-        return {
-            'statusCode': 500,
-            'body': json.dumps({
-                'error': 'Internal server error',
-                'message': str(e),
-                'source': 'retention_offer'
-            })
-        }
+        return build_response(event, 500, {
+            'error': 'Internal server error',
+            'message': str(e),
+            'source': 'retention_offer'
+        })
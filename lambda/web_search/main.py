@@ -1,10 +1,22 @@
-import json
+import orjson
 import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Any
 from ddgs import DDGS
 
 # Configure logging
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+logger = logging.getLogger(__name__)
+logger.setLevel(os.environ.get('LOG_LEVEL', 'INFO').upper())
+
+# Search client reused across warm invocations so its HTTP connections stay open
+_ddgs = DDGS()
+
+# Recent search results kept per warm container: (region, max_results, keywords) -> (fetched_at, results)
+SEARCH_CACHE_TTL_SECONDS = int(os.environ.get('SEARCH_CACHE_TTL_SECONDS', '1800'))
+SEARCH_CACHE_MAX_ENTRIES = 256
+_search_cache = OrderedDict()
 
 def web_search(keywords: str, region: str = "us-en", max_results: int = 5):
     """Search the web for updated information.
@@ -17,13 +29,56 @@ def web_search(keywords: str, region: str = "us-en", max_results: int = 5):
     Returns:
         List of dictionaries with search results.
     """
+    key = (region, max_results, keywords.strip().lower())
+    cached = _search_cache.get(key)
+    if cached and time.monotonic() - cached[0] < SEARCH_CACHE_TTL_SECONDS:
+        _search_cache.move_to_end(key)
+        return cached[1]
+    
     try:
-        results = DDGS().text(keywords, region=region, max_results=max_results)
-        return results if results else []
+        results = _ddgs.text(keywords, region=region, max_results=max_results)
+        if not results:
+            return []
+        _search_cache[key] = (time.monotonic(), results)
+        _search_cache.move_to_end(key)
+        if len(_search_cache) > SEARCH_CACHE_MAX_ENTRIES:
+            _search_cache.popitem(last=False)
+        return results
     except Exception as e:
         logger.error(f"DDGS search error: {str(e)}")
         return []
 
+def extract_payload(event) -> Dict[str, Any]:
+    """
+    Return the request data: the parsed body for API Gateway events, the event itself otherwise.
+    
+    Args:
+        event: The Lambda event
+        
+    Returns:
+        Dict of request parameters
+    """
+    if 'body' not in event:
+        return event
+    body = event['body']
+    return orjson.loads(body) if isinstance(body, (str, bytes)) else (body or {})
+
+def build_response(event, status_code: int, payload: Dict[str, Any]):
+    """
+    Wrap a payload for API Gateway; direct (agent/Gateway) invocations get the dict itself.
+    
+    Args:
+        event: The Lambda event being answered
+        status_code (int): HTTP status code for API Gateway callers
+        payload (Dict[str, Any]): Response data
+        
+    Returns:
+        API Gateway proxy response, or payload unchanged for direct invocations
+    """
+    if isinstance(event, dict) and 'body' in event:
+        return {'statusCode': status_code, 'body': orjson.dumps(payload).decode()}
+    return payload
+
 def lambda_handler(event, context):
     """
     Web Search Lambda function for Customer Retention Agent.
@@ -41,30 +96,20 @@ def lambda_handler(event, context):
     """
     
     try:
-        # Handle API Gateway event
-        if 'body' in event:
-            # API Gateway event - parse JSON body
-            body = json.loads(event['body']) if isinstance(event['body'], str) else event['body']
-            query = body.get('query', '')
-            region = body.get('region', 'us-en')
-            max_results = body.get('max_results', 5)
-        else:
-            # Direct invocation event
-            query = event.get('query', '')
-            region = event.get('region', 'us-en')
-            max_results = event.get('max_results', 5)
+        # API Gateway body or direct invocation event
+        body = extract_payload(event)
+        query = body.get('query', '')
+        region = body.get('region', 'us-en')
+        max_results = body.get('max_results', 5)
         
-        logger.info(f"Processing web search request for query: {query}")
+        logger.debug(f"Processing web search request for query: {query}")
         
         # Validate input
         if not query or not query.strip():
-            return {
-                'statusCode': 400,
-                'body': json.dumps({
-                    'error': 'Search query is required',
-                    'query': query
-                })
-            }
+            return build_response(event, 400, {
+                'error': 'Search query is required',
+                'query': query
+            })
         
         # Perform web search using DDGS
         search_results = web_search(query, region, max_results)
@@ -79,28 +124,29 @@ def lambda_handler(event, context):
                 'source': 'web_search'
             })
         
-        response = {
-            'statusCode': 200,
-            'body': json.dumps({
-                'query': query,
-                'region': region,
-                'results': formatted_results,
-                'total_results': len(formatted_results),
-                'source': 'web_search'
-            })
-        }
+        response = build_response(event, 200, {
+            'query': query,
+            'region': region,
+            'results': formatted_results,
+            'total_results': len(formatted_results),
+            'source': 'web_search'
+        })
         
-        logger.info(f"Successfully processed search request. Found {len(formatted_results)} results.")
+        # One structured line per invocation for Logs Insights
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(orjson.dumps({
+                'event': 'web_search',
+                'region': region,
+                'max_results': max_results,
+                'result_count': len(formatted_results)
+            }).decode())
         return response
         
     except Exception as e:
         logger.error(f"Error processing web search request: {str(e)}")
-        return {
-            'statusCode': 500,
-            'body': json.dumps({
-                'error': 'Internal server error',
-                'message': str(e),
-                'source': 'web_search'
-            })
-        }
+        return build_response(event, 500, {
+            'error': 'Internal server error',
+            'message': str(e),
+            'source': 'web_search'
+        })
 